@@ -1,10 +1,68 @@
+import copy
+import csv
+import functools
+import hashlib
+import importlib
+import importlib.util
+import itertools
 import json
+import math
+import operator
 import sys
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
+from json.encoder import encode_basestring_ascii
 import logging
+import os
+import random
 import re
-
-import requests
+import sqlite3
+import threading
+import time
+import traceback
+from contextlib import nullcontext
+from urllib.parse import urlencode, urlparse
+
+
+class _LazyModule(object):
+    """
+    Stand-in for a module that is imported on first attribute access.
+    importlib.util.LazyLoader is not used: before Python 3.12 a thread that
+    touches the module while another one is executing it sees a half-empty
+    module.
+    """
+
+    def __init__(self, name):
+        self.__name__ = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    # модуль, которого нет, падает здесь ModuleNotFoundError
+                    self._module = importlib.import_module(self.__name__)
+                module = self._module
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """
+    Module `name` that is only executed on first attribute access, so the
+    short paths of the CLI never pay for importing it. A module that is not
+    installed fails on first use too, not on import.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return _LazyModule(name)
+
+
+asyncio = lazy_import("asyncio")
+multiprocessing = lazy_import("multiprocessing")
+requests = lazy_import("requests")
 
 """
 Decorators
@@ -18,12 +76,233 @@ def try_or_none(func):
             return func(*args, **kwargs)
         except Exception as e:
             logging.error(str(e))
+            METRICS.inc("errors", func=func.__name__)
             return None
 
     return wrapper
 
 
+"""
+Metrics
+
+"""
+
+
+class _Span(object):
+    __slots__ = ("metrics", "key", "start")
+
+    def __init__(self, metrics, key):
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics._observe(self.key, time.perf_counter() - self.start)
+
+
+class Metrics(object):
+    """
+    Counters and timing spans of one run, keyed by name and labels.
+
+    Exported as a JSON summary or in the Prometheus text format; `write`
+    picks the format from the file extension (.prom or .json).
+    """
+
+    enabled = True
+    prefix = "profitbase"
+
+    def __init__(self):
+        self.counters = Counter()
+        # key -> [count, total seconds, max seconds]
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] += value
+
+    def span(self, name, **labels):
+        return _Span(self, self._key(name, labels))
+
+    def observe(self, name, seconds, **labels):
+        self._observe(self._key(name, labels), seconds)
+
+    def _observe(self, key, seconds):
+        with self._lock:
+            timing = self.timings.setdefault(key, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    def summary(self):
+        def label(key):
+            name, labels = key
+            if not labels:
+                return name
+            return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+        with self._lock:
+            return {
+                "counters": {label(key): value for key, value in sorted(self.counters.items())},
+                "timings": {
+                    label(key): {"count": count, "seconds": total, "max_seconds": longest}
+                    for key, (count, total, longest) in sorted(self.timings.items())
+                },
+            }
+
+    def to_prometheus(self):
+        def series(name, labels, suffix=""):
+            metric = f"{self.prefix}_{name}{suffix}"
+            if not labels:
+                return metric
+            return metric + "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timings = sorted(self.timings.items())
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {self.prefix}_{name}_total counter")
+            lines.append(f"{series(name, labels, '_total')} {value}")
+        for (name, labels), (count, total, longest) in timings:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {self.prefix}_{name}_seconds summary")
+            lines.append(f"{series(name, labels, '_seconds_count')} {count}")
+            lines.append(f"{series(name, labels, '_seconds_sum')} {total:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".prom"):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.summary(), f, indent=4, ensure_ascii=False)
+
+
+class NullMetrics(object):
+    """Default sink: every call is a no-op."""
+
+    enabled = False
+    _span = nullcontext()
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def span(self, name, **labels):
+        return self._span
+
+    def observe(self, name, seconds, **labels):
+        pass
+
+
+METRICS = NullMetrics()
+
+
+def enable_metrics():
+    """Start collecting metrics for this process and return the collector."""
+    global METRICS
+    METRICS = Metrics()
+    return METRICS
+
+
+def ordered_map(func, items, workers, executor=None):
+    """
+    Run func over items on a thread pool of `workers` threads (or on the
+    given executor) and yield the results in input order. Only a bounded
+    window of calls is queued ahead, so a slow call never makes the whole
+    input pile up in memory.
+    """
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from ordered_map(func, items, workers, executor)
+        return
+    pending = deque()
+    for item in items:
+        if len(pending) >= workers * 2:
+            yield pending.popleft().result()
+        pending.append(executor.submit(func, item))
+    while pending:
+        yield pending.popleft().result()
+
+
+def chunked(items, size):
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 class EstateObject(object):
+    # Порядок полей в выгрузке
+    FIELDS = (
+        "complex",
+        "type",
+        "phase",
+        "building",
+        "section",
+        "price_base",
+        "price_finished",
+        "price_sale",
+        "price_finished_sale",
+        "area",
+        "living_area",
+        "number",
+        "number_on_site",
+        "rooms",
+        "floor",
+        "in_sale",
+        "sale_status",
+        "finished",
+        "currency",
+        "ceil",
+        "article",
+        "finishing_name",
+        "furniture",
+        "furniture_price",
+        "plan",
+        "feature",
+        "view",
+        "euro_planning",
+        "sale",
+        "discount_percent",
+        "discount",
+        "comment",
+        "flat_url",
+        "comissioning",
+        "cession",
+    )
+    __slots__ = FIELDS
+    # Поля, в которые парсеры пишут Decimal
+    DECIMAL_FIELDS = (
+        "price_base",
+        "price_finished",
+        "price_sale",
+        "price_finished_sale",
+        "area",
+        "living_area",
+        "ceil",
+        "discount",
+    )
+    _FIELD_SET = frozenset(FIELDS)
+    _get_values = operator.attrgetter(*FIELDS)
+    # Текст JSON записи, в который подставляются только значения полей
+    _JSON_TEMPLATE = "{" + ", ".join(f'"{field}": %s' for field in FIELDS) + "}"
+    _JSON_TEMPLATE_INDENT = "{\n" + ",\n".join(f'    "{field}": %s' for field in FIELDS) + "\n}"
+
     def __init__(self):
         # Название жилого комплекса + регион
         self.complex: str = None
@@ -106,21 +385,456 @@ class EstateObject(object):
         # Переуступка. Можно ставить только 1, там где это понятно
         self.cession: int = None
 
+    # Доступ как к dict, как было до перехода на __slots__. Набор ключей
+    # фиксирован: новые ключи не добавляются и не удаляются.
+    def __getitem__(self, field):
+        if field not in self._FIELD_SET:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __setitem__(self, field, value):
+        if field not in self._FIELD_SET:
+            raise KeyError(field)
+        setattr(self, field, value)
+
+    def __eq__(self, other):
+        if isinstance(other, EstateObject):
+            return self.to_tuple() == other.to_tuple()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __contains__(self, field):
+        return field in self._FIELD_SET
+
+    def get(self, field, default=None):
+        return getattr(self, field) if field in self._FIELD_SET else default
+
+    def keys(self):
+        return self.FIELDS
+
+    def values(self):
+        return [getattr(self, field) for field in self.FIELDS]
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in self.FIELDS]
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def to_tuple(self):
+        return tuple(getattr(self, field) for field in self.FIELDS)
+
+    @classmethod
+    def from_tuple(cls, values):
+        obj = cls.__new__(cls)
+        for field, value in zip(cls.FIELDS, values):
+            setattr(obj, field, value)
+        return obj
+
+    @classmethod
+    def from_dict(cls, values):
+        obj = cls()
+        for field in cls.FIELDS:
+            setattr(obj, field, values.get(field))
+        return obj
+
+    def to_plain(self):
+        """to_dict() with the Decimal fields converted to float, as written out."""
+        values = {field: getattr(self, field) for field in self.FIELDS}
+        for field in self.DECIMAL_FIELDS:
+            value = values[field]
+            if value.__class__ is Decimal:
+                values[field] = float(value)
+        return values
+
+    def to_json(self, indent=False):
+        """
+        Same text as json.dumps(self.to_dict(), cls=DecimalEncoder), or with
+        `indent` as json.dumps(..., indent=4, cls=DecimalEncoder). Field
+        names come from a prebuilt template and only the values are encoded,
+        the common ones (None, str) without a function call.
+        """
+        if indent:
+            template, encode_nested = self._JSON_TEMPLATE_INDENT, _encode_nested_indent
+        else:
+            template, encode_nested = self._JSON_TEMPLATE, _encode_nested
+        encoders = _SCALAR_ENCODERS
+        return template % tuple(
+            [
+                "null" if value is None
+                else encode_basestring_ascii(value) if value.__class__ is str
+                else encoders.get(value.__class__, encode_nested)(value)
+                for value in self._get_values(self)
+            ]
+        )
+
+
+def _decimal_default(o):
+    if isinstance(o, Decimal):
+        return float(o)
+    if isinstance(o, EstateObject):
+        return o.to_plain()
+    raise TypeError(f"Object of type {o.__class__.__name__} is not JSON serializable")
+
+
+_encode_nested = json.JSONEncoder(check_circular=False, default=_decimal_default).encode
+
+
+def _encode_nested_indent(value):
+    # значение поля на втором уровне вложенности
+    return json.dumps(value, indent=4, default=_decimal_default).replace("\n", "\n    ")
+
+
+def _encode_float(value):
+    if math.isfinite(value):
+        return float.__repr__(value)
+    return _encode_nested(value)
+
+
+_SCALAR_ENCODERS = {
+    int: int.__repr__,
+    float: _encode_float,
+    bool: lambda value: "true" if value else "false",
+    Decimal: lambda value: _encode_float(float(value)),
+}
+
+
+"""
+JSON codecs
+
+"""
+
+
+class JsonCodec(object):
+    """
+    stdlib json. loads() takes str or bytes; with `decimal` floats are read
+    as Decimal. dumps() returns str and writes Decimal as float and
+    EstateObject as its fields; `compact` drops all optional whitespace and
+    keeps non-ASCII as is, otherwise the output is indented.
+    """
+
+    name = "json"
+
+    def loads(self, data, decimal=False):
+        if decimal:
+            return json.loads(data, parse_float=Decimal)
+        return json.loads(data)
+
+    def dumps(self, obj, compact=True):
+        if compact:
+            return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=_decimal_default)
+        return json.dumps(obj, indent=4, default=_decimal_default)
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+
+    def loads(self, data, decimal=False):
+        if decimal:
+            # orjson не умеет читать числа в Decimal
+            return super().loads(data, decimal)
+        return self._orjson.loads(data)
+
+    def dumps(self, obj, compact=True):
+        option = self._orjson.OPT_NON_STR_KEYS
+        if not compact:
+            option |= self._orjson.OPT_INDENT_2
+        return self._orjson.dumps(obj, default=_decimal_default, option=option).decode("utf-8")
+
+
+class UjsonCodec(JsonCodec):
+    name = "ujson"
+
+    def __init__(self):
+        import ujson
+
+        self._ujson = ujson
+
+    def loads(self, data, decimal=False):
+        if decimal:
+            return super().loads(data, decimal)
+        return self._ujson.loads(data)
+
+    def dumps(self, obj, compact=True):
+        return self._ujson.dumps(
+            obj, ensure_ascii=False, indent=0 if compact else 4, default=_decimal_default
+        )
+
+
+# В порядке предпочтения
+CODECS = {"orjson": OrjsonCodec, "ujson": UjsonCodec, "json": JsonCodec}
+
+
+def get_codec(name=None):
+    """
+    Codec by name, or the fastest one installed. PROFITBASE_JSON_CODEC
+    overrides the default choice.
+    """
+    name = name or os.environ.get("PROFITBASE_JSON_CODEC")
+    if name:
+        return CODECS[name]()
+    for codec_class in CODECS.values():
+        try:
+            return codec_class()
+        except ImportError:
+            continue
+
+
+@functools.lru_cache(maxsize=None)
+def default_codec():
+    """get_codec(), created on first use so the codec package loads lazily."""
+    return get_codec()
+
+
+def records_to_tuples(records):
+    """Rows in EstateObject.FIELDS order."""
+    return [record.to_tuple() for record in records]
+
+
+def records_to_columns(records):
+    """{field: [values]} in EstateObject.FIELDS order."""
+    columns = {field: [] for field in EstateObject.FIELDS}
+    appenders = [columns[field].append for field in EstateObject.FIELDS]
+    for record in records:
+        for append, field in zip(appenders, EstateObject.FIELDS):
+            append(getattr(record, field))
+    return columns
+
+
+"""
+Normalization
+
+"""
+
+
+PHASE_RE = re.compile(r"\d+ этап", flags=re.IGNORECASE)
+HOUSE_RE = re.compile(r"дом", flags=re.IGNORECASE)
+DIGITS_RE = re.compile(r"\d+")
+
+# На один ЖК приходится несколько разных houseName/section, поэтому
+# результаты нормализации кэшируются по входной строке.
+NORMALIZE_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_building(value):
+    if not PHASE_RE.search(value):
+        return HOUSE_RE.sub("", value).strip()
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_phase(value):
+    if PHASE_RE.search(value):
+        return DIGITS_RE.search(value).group()
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_section(value):
+    return value.lower().replace("подъезд", "").strip()
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def split_apartment_house(house_name):
+    """(building, phase) from an apartment houseName."""
+    if "очередь" in house_name:
+        building = normalize_building(house_name.split(",")[-1]).replace("№", "")
+        phase = normalize_building(house_name.split(",")[0].replace("очередь", ""))
+        return building, phase
+    return normalize_building(house_name).replace("№", ""), None
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def split_commercial_house(house_name):
+    """(building, phase) from a commercial premises houseName."""
+    phase = None
+    if "очередь" in house_name:
+        phase = house_name.split(" ")[0].replace("очередь", "")
+    return house_name.replace("Дом №", ""), phase
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def split_parking_house(house_name):
+    """(building, phase) from a pantry houseName."""
+    phase = None
+    if "очередь" in house_name:
+        phase = house_name.split("-")[-1].replace("очередь", "")
+    return house_name.replace("Дом №", ""), phase
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def strip_section_word(value):
+    return value.lower().replace("секция", "")
+
+
+NORMALIZERS = (
+    normalize_building,
+    normalize_phase,
+    normalize_section,
+    split_apartment_house,
+    split_commercial_house,
+    split_parking_house,
+    strip_section_word,
+)
+
+
+def normalize_cache_info():
+    """Hit/miss statistics of every normalization cache."""
+    return {func.__name__: func.cache_info()._asdict() for func in NORMALIZERS}
+
+
+class CustomFields(object):
+    """custom_fields of one record, indexed by id in a single pass."""
+
+    def __init__(self, custom_fields):
+        self.fields = custom_fields
+        self.by_id = {}
+        for field in custom_fields:
+            self.by_id.setdefault(field["id"], field)
+
+    def get(self, field_id):
+        return self.by_id.get(field_id)
+
+
+# Признаки квартиры по названию custom field со значением "Есть".
+# Правила проверяются по порядку, срабатывает первое совпавшее:
+# FEATURE - добавить признак, VIEW - название поля идёт в вид из окна,
+# SKIP - поле известно, но в выгрузку не попадает.
+FEATURE, VIEW, SKIP = "feature", "view", "skip"
+FEATURE_RULES = (
+    ("Кухня-гостиная", FEATURE),
+    ("Теплая лоджия", FEATURE),
+    ("Большая прихожая", FEATURE),
+    ("Второй санузел", FEATURE),
+    ("Чистовая", SKIP),
+    ("Гардеробная", FEATURE),
+    ("Окна на две стороны", FEATURE),
+    ("Вид", VIEW),
+    ("Мастер-спальня", FEATURE),
+    ("Балкон", FEATURE),
+    ("Лоджия", FEATURE),
+)
+
+
+class FeatureRules(object):
+    """
+    Substring rules for custom field names compiled into one regex.
+
+    Every rule is a zero-width lookahead alternative, so a single scan finds
+    all rules present in a name and the lowest rule index wins, exactly as
+    in an if/elif chain. Results are memoized per distinct name. Names that
+    match no rule are logged once and counted in `unknown`.
+    """
+
+    def __init__(self, rules=FEATURE_RULES):
+        self.rules = tuple(rules)
+        self.pattern = re.compile(
+            "|".join(f"(?=({re.escape(substring)}))" for substring, _ in self.rules)
+        )
+        self.unknown = Counter()
+        self._cache = {}
+
+    def match(self, name):
+        """(action, substring) of the first matching rule, or None."""
+        try:
+            rule = self._cache[name]
+        except KeyError:
+            hits = [m.lastindex for m in self.pattern.finditer(name)]
+            rule = self._cache[name] = self.rules[min(hits) - 1] if hits else None
+            if rule is None:
+                logging.warning(f"New feature {name}")
+        if rule is None:
+            self.unknown[name] += 1
+            METRICS.inc("unknown_features")
+        return rule
+
 
 class BaseParser(object):
-    def __init__(self, host, comissions):
+    # Поля объекта /property, которые читает parse()
+    RAW_FIELDS = (
+        "id",
+        "house_id",
+        "projectName",
+        "houseName",
+        "floor",
+        "number",
+        "status",
+        "area",
+        "price",
+        "planImages",
+        "specialOffers",
+    )
+    # Нужен ли parse() ответ с full=true (custom_fields)
+    FULL_PAYLOAD = False
+    # EstateObject.type записей парсера
+    TYPE = None
+
+    def __init__(self, host, comissions, region="Анапа"):
         self.host = host
         self.comissions = comissions
+        # Регион, который дописывается к названию ЖК
+        self.region = region
+
+    @classmethod
+    def trim(cls, data):
+        """
+        Copy of a raw /property object cut down to what parse() reads: the
+        RAW_FIELDS, the first plan image and the first special offer. An
+        object that does not have the expected shape is returned untouched,
+        so that parse() fails on it where a quarantine can set it aside.
+        """
+        try:
+            return cls._trim(data)
+        except (KeyError, IndexError, TypeError, AttributeError):
+            return data
+
+    @classmethod
+    def _trim(cls, data):
+        slim = {key: data[key] for key in cls.RAW_FIELDS if key in data}
+        if "area" in slim:
+            area = slim["area"]
+            slim["area"] = {key: area[key] for key in ("area_total", "area_living") if key in area}
+        if slim.get("planImages"):
+            slim["planImages"] = [{"source": slim["planImages"][0]["source"]}]
+        if slim.get("specialOffers"):
+            offer = slim["specialOffers"][0]
+            discount = offer["discount"]
+            slim["specialOffers"] = [
+                {
+                    "name": offer.get("name"),
+                    "discount": {
+                        "unit": discount["unit"],
+                        "value": discount["value"],
+                        "calculate": {"price": discount["calculate"]["price"]},
+                    },
+                }
+            ]
+        if "custom_fields" in slim:
+            slim["custom_fields"] = cls.trim_custom_fields(slim["custom_fields"])
+        return slim
+
+    @classmethod
+    def trim_custom_fields(cls, custom_fields):
+        return [{"id": f["id"], "name": f["name"], "value": f["value"]} for f in custom_fields]
 
     def get_building(self, value):
-        is_phase = re.search(r"\d+ этап", value, flags=re.IGNORECASE)
-        if not is_phase:
-            return re.sub(r"дом", "", value, flags=re.IGNORECASE).strip()
+        return normalize_building(value)
 
     def get_phase(self, value):
-        is_phase = re.search(r"\d+ этап", value, flags=re.IGNORECASE)
-        if is_phase:
-            return re.search(r"\d+", value).group()
+        return normalize_phase(value)
 
     def get_rooms(self, rooms, is_studio):
         if is_studio:
@@ -131,22 +845,23 @@ class BaseParser(object):
         return Decimal(price_node["value"])
 
     def get_section(self, value):
-        return value.lower().replace("подъезд", "").strip()
+        return normalize_section(value)
 
     def get_plan(self, value):
         if value and len(value):
             return value[0]["source"]
         return None
 
-    def get_view(self, data):
-        view_block = filter(lambda e: e["id"] == "window", data["custom_fields"])
-        view_block = tuple(view_block)
-        if len(view_block):
-            views = view_block[0]["value"]
+    def get_view(self, data, fields=None):
+        view_block = self._custom_field_by_id(fields or data["custom_fields"], "window")
+        if view_block:
+            views = view_block["value"]
             return [views] if views else None
         return None
 
     def _custom_field_by_id(self, custom_fields, field_id):
+        if isinstance(custom_fields, CustomFields):
+            return custom_fields.get(field_id)
         field = tuple(filter(lambda e: e["id"] == field_id, custom_fields))
         return field[0] if len(field) else None
 
@@ -210,18 +925,69 @@ class BaseParser(object):
         return "; ".join(result) if len(result) else None
 
     def get_prices(self, data):
-        price = self.dec_or_none(data["price"]["value"])
-        price_sale = None
-
-        if len(data["specialOffers"]):
-            offer = data["specialOffers"][0]
-            discount = offer["discount"]
-            price_sale = discount["calculate"]["price"]
-            price_sale = Decimal(int(price_sale)) if price_sale else None
-            if price_sale == price:
-                price_sale = None
-
-        return price, price_sale
+        return self.price_row(data)[:2]
+
+    def price_rows(self, items):
+        """
+        Prices of a page of items in one pass: (price, sale price, discount
+        sum, discount percent) per item. Each item's first offer is read
+        once and no helper is called per item. An item that cannot be
+        priced gets its exception instead of a row, so one bad item does
+        not fail the page; parse() raises it for that item.
+        """
+        rows = []
+        append = rows.append
+        for data in items:
+            try:
+                value = data["price"]["value"]
+                price = Decimal(value) if value else None
+                offers = data["specialOffers"]
+                if not len(offers):
+                    append((price, None, None, None))
+                    continue
+                discount = offers[0]["discount"]
+                price_sale = discount["calculate"]["price"]
+                price_sale = Decimal(int(price_sale)) if price_sale else None
+                if price_sale == price:
+                    price_sale = None
+                unit = discount["unit"]
+                value = discount["value"]
+                append(
+                    (
+                        price,
+                        price_sale,
+                        price - price_sale if price and price_sale else None,
+                        float(value) if value and unit.lower() == "percent" else None,
+                    )
+                )
+            except Exception as e:
+                append(e)
+        return rows
+
+    def price_row(self, data):
+        """price_rows() of a single item; raises if it cannot be priced."""
+        row = self.price_rows((data,))[0]
+        if isinstance(row, Exception):
+            raise row
+        return row
+
+    def parse_page(self, items):
+        """parse() for every item of a page, priced by price_rows."""
+        return [self.parse(data, prices) for data, prices in zip(items, self.price_rows(items))]
+
+    def parse_page_isolated(self, items, on_error):
+        """
+        parse_page() that survives bad items: each item is parsed once, and
+        one that raises, in pricing or in parse(), is handed to
+        on_error(data, exc) and left out of the result.
+        """
+        records = []
+        for data, prices in zip(items, self.price_rows(items)):
+            try:
+                records.append(self.parse(data, prices))
+            except Exception as e:
+                on_error(data, e)
+        return records
 
     def get_discount(self, price, sale_price):
         if price and sale_price:
@@ -229,18 +995,7 @@ class BaseParser(object):
         return None
 
     def get_discount_percent(self, data):
-        discount_percent = None
-        if len(data["specialOffers"]):
-            offer = data["specialOffers"][0]
-            discount = offer["discount"]
-            units = discount["unit"]
-
-            dicount_value = discount["value"]
-            if dicount_value:
-                if units.lower() == "percent":
-                    discount_percent = float(dicount_value)
-
-        return discount_percent
+        return self.price_row(data)[3]
 
     def get_sale_status(self, value):
         return {"AVAILABLE": "Свободно", "BOOKED": "Забронировано", "SOLD": "Продано"}[
@@ -259,10 +1014,28 @@ class BaseParser(object):
 
 
 class ApartmentParser(BaseParser):
-    def parse(self, data):
+    RAW_FIELDS = BaseParser.RAW_FIELDS + ("section", "studio", "rooms_amount", "custom_fields")
+    FULL_PAYLOAD = True
+    TYPE = 'flat'
+
+    @classmethod
+    def trim_custom_fields(cls, custom_fields):
+        # Пустые поля parse() ни на что не влияют, кроме "Цена при ..."
+        return [
+            {"id": f["id"], "name": f["name"], "value": f["value"]}
+            for f in custom_fields
+            if f["value"] or "Цена при" in f["name"]
+        ]
+
+    def __init__(self, host, comissions, region="Анапа", feature_rules=None):
+        super().__init__(host, comissions, region)
+        self.feature_rules = feature_rules or FeatureRules()
+
+    def parse(self, data, prices=None):
         estate_obj = EstateObject()
-        estate_obj.type = 'flat'
-        estate_obj.complex = f"{data['projectName']} (Анапа)"
+        estate_obj.type = self.TYPE
+        estate_obj.complex = f"{data['projectName']} ({self.region})"
+        fields = CustomFields(data['custom_fields'])
 
         estate_obj.floor = data['floor']
         if data['studio']:
@@ -271,116 +1044,98 @@ class ApartmentParser(BaseParser):
             estate_obj.rooms= data['rooms_amount']
         if data['status'] not in ['SOLD']:
             estate_obj.in_sale = 1
-        if 'очередь' in data['houseName']:
-            estate_obj.building = self.get_building(data['houseName'].split(',')[-1]).replace('№', '')
-            estate_obj.phase = self.get_building(data['houseName'].split(',')[0].replace('очередь', ''))
-        else:
-            estate_obj.building = self.get_building(data['houseName']).replace('№', '')
+        estate_obj.building, estate_obj.phase = split_apartment_house(data['houseName'])
 
         estate_obj.number = data['number']
-        estate_obj.section = data['section'].lower().replace('секция', '')
+        estate_obj.section = strip_section_word(data['section'])
         estate_obj.area = Decimal(data['area']['area_total'])
         if data['area']['area_living']:
             estate_obj.living_area = Decimal(data['area']['area_living'])
         estate_obj.plan = self.get_plan(data['planImages'])
-        estate_obj.view = self.get_view(data)
+        estate_obj.view = self.get_view(data, fields)
         estate_obj.sale_status = self.get_sale_status(data['status'])
-        estate_obj.finished = self.get_finished(data['custom_fields'])
+        estate_obj.finished = self.get_finished(fields)
         estate_obj.flat_url = self.get_flat_url(data)
         estate_obj.comissioning = self.comissions[data['house_id']]
 
-        price, price_sale = self.get_prices(data)
+        if not isinstance(prices, tuple):
+            # None, или ошибка, которую price_rows отложил для этого объекта
+            prices = self.price_row(data)
+        price, price_sale = prices[0], prices[1]
 
-        for element in data['custom_fields']:
-            if 'Балкон' in element['name'] and element['value'] == 'Есть':
-                estate_obj.feature = 'Балкон'
-            if 'Цена при' in element['name']:
-                price_sale = element['value']
-                estate_obj.sale = (element['name'])
+        features = []
+        for field in fields.fields:
+            name = field['name']
+            if 'Цена при' in name:
+                price_sale = field['value']
+                estate_obj.sale = name
+            if field['value'] and 'Есть' in str(field['value']):
+                rule = self.feature_rules.match(name)
+                if rule is None:
+                    continue
+                substring, action = rule
+                if action == FEATURE:
+                    features.append(substring)
+                elif action == VIEW:
+                    estate_obj.view = name
 
         if estate_obj.finished:
             estate_obj.price_finished = Decimal(price)
             if price_sale:
                 estate_obj.price_finished_sale = Decimal(price_sale)
-            estate_obj.finishing_name = self.get_finishing_name(data['custom_fields'])
+            estate_obj.finishing_name = self.get_finishing_name(fields)
         else:
             estate_obj.price_base = Decimal(price)
             if price_sale:
                 estate_obj.price_sale = Decimal(price_sale)
-        features = []
-        for field in data['custom_fields']:
-            if field['value'] and 'Есть' in str(field['value']):
-                if 'Кухня-гостиная' in field['name']:
-                    features.append('Кухня-гостиная')
-                elif 'Теплая лоджия' in field['name']:
-                    features.append('Теплая лоджия')
-                elif 'Большая прихожая' in field['name']:
-                    features.append('Большая прихожая')
-                elif 'Второй санузел' in field['name']:
-                    features.append('Второй санузел')
-                elif 'Чистовая' in field['name']:
-                    pass
-                elif 'Гардеробная' in field['name']:
-                    features.append('Гардеробная')
-                elif 'Окна на две стороны' in field['name']:
-                    features.append('Окна на две стороны')
-                elif 'Вид' in field['name']:
-                    estate_obj.view = field['name']
-                elif 'Мастер-спальня' in field['name']:
-                    features.append('Мастер-спальня')
-                elif 'Балкон' in field['name']:
-                    features.append('Балкон')
-                elif 'Лоджия' in field['name']:
-                    features.append('Лоджия')
-                else:
-                    raise Exception(f'New feature {field["name"]}')
         estate_obj.feature = features if features else None
-        return estate_obj.__dict__
+        return estate_obj
 
 
 class CommercialParser(BaseParser):
-    def parse(self, data):
+    RAW_FIELDS = BaseParser.RAW_FIELDS + ("sectionName",)
+    TYPE = 'commercial'
+
+    def parse(self, data, prices=None):
         estate_obj = EstateObject()
-        estate_obj.complex = f"{data['projectName']} (Анапа)"
-        if 'очередь' in data['houseName']:
-            estate_obj.phase = data['houseName'].split(' ')[0].replace('очередь', '')
-        estate_obj.type = 'commercial'
+        estate_obj.complex = f"{data['projectName']} ({self.region})"
+        estate_obj.building, estate_obj.phase = split_commercial_house(data['houseName'])
+        estate_obj.type = self.TYPE
 
         if data['status'] not in ['SOLD']:
             estate_obj.in_sale = 1
         if data['sectionName']:
-            estate_obj.section = data['sectionName'].lower().replace('секция', '').strip()
+            estate_obj.section = strip_section_word(data['sectionName']).strip()
         estate_obj.floor = data['floor']
         estate_obj.number = data['number'].strip()
         estate_obj.area = Decimal(data['area']['area_total'])
         estate_obj.plan = self.get_plan(data['planImages'])
         estate_obj.sale_status = self.get_sale_status(data['status'])
         estate_obj.flat_url = self.get_flat_url(data)
-        estate_obj.building = data['houseName'].replace('Дом №', '')
         estate_obj.comissioning = self.comissions[data['house_id']]
 
-        price, price_sale = self.get_prices(data)
-        estate_obj.discount = self.get_discount(price, price_sale)
-        estate_obj.discount_percent = self.get_discount_percent(data)
+        if not isinstance(prices, tuple):
+            prices = self.price_row(data)
+        price, price_sale, estate_obj.discount, estate_obj.discount_percent = prices
         estate_obj.price_base = price
         estate_obj.price_sale = price_sale
-        return estate_obj.__dict__
+        return estate_obj
 
 
 class ParkingParser(BaseParser):
-    def parse(self, data):
+    RAW_FIELDS = BaseParser.RAW_FIELDS + ("section",)
+    TYPE = 'storeroom'
+
+    def parse(self, data, prices=None):
         estate_obj = EstateObject()
 
-        estate_obj.complex = f"{data['projectName']} (Анапа)"
-        estate_obj.type = 'storeroom'
+        estate_obj.complex = f"{data['projectName']} ({self.region})"
+        estate_obj.type = self.TYPE
         if data['status'] not in ['SOLD']:
             estate_obj.in_sale = 1
         if data['section'] != '_':
-            estate_obj.section = self.get_section(data['section'].lower().replace('секция', ''))
-        estate_obj.phase = None
-        estate_obj.building = data['houseName'].replace('Дом №', '')
-        if 'очередь' in data['houseName']:
-            estate_obj.phase = data['houseName'].split('-')[-1].replace('очередь', '')
+            estate_obj.section = self.get_section(strip_section_word(data['section']))
+        estate_obj.building, estate_obj.phase = split_parking_house(data['houseName'])
         estate_obj.floor = data['floor']
         estate_obj.number = data['number'].strip()
         estate_obj.area = Decimal(data['area']['area_total'])
@@ -389,13 +1144,13 @@ class ParkingParser(BaseParser):
         estate_obj.flat_url = self.get_flat_url(data)
         estate_obj.comissioning = self.comissions[data['house_id']]
 
-        price, price_sale = self.get_prices(data)
-        estate_obj.discount = self.get_discount(price, price_sale)
-        estate_obj.discount_percent = self.get_discount_percent(data)
+        if not isinstance(prices, tuple):
+            prices = self.price_row(data)
+        price, price_sale, estate_obj.discount, estate_obj.discount_percent = prices
         estate_obj.price_base = price
         estate_obj.price_sale = price_sale
 
-        return estate_obj.__dict__
+        return estate_obj
 
 
 """
@@ -408,28 +1163,425 @@ class DecimalEncoder(json.JSONEncoder):
     def default(self, o):
         if isinstance(o, Decimal):
             return float(o)
+        if isinstance(o, EstateObject):
+            return o.to_dict()
         return super(DecimalEncoder, self).default(o)
 
 
-def dumpResult(results_dict):
-    json.dump(results_dict, sys.stdout, indent=4, cls=DecimalEncoder)
+def dumpResult(results_dict, stream=None, compact=False, codec=None):
+    """
+    Write the result as one JSON document, indented by default. `compact`
+    output goes through `codec` (default_codec() by default).
+    """
+    stream = stream or sys.stdout
+    with METRICS.span("dump", format="json"):
+        if compact:
+            stream.write((codec or default_codec()).dumps(results_dict))
+        else:
+            json.dump(results_dict, stream, indent=4, cls=DecimalEncoder)
+
+
+def dump_ndjson(records, stream=None, codec=None):
+    """
+    Write records one JSON document per line as they are produced. Without
+    `codec` the lines match json.dumps; a codec writes them compact.
+    """
+    stream = stream or sys.stdout
+    count = 0
+    # только кодирование и запись, без получения записей из генератора
+    spent = 0.0
+    for record in records:
+        start = time.perf_counter()
+        if codec is not None:
+            stream.write(codec.dumps(record))
+        elif isinstance(record, EstateObject):
+            stream.write(record.to_json())
+        else:
+            stream.write(json.dumps(record, cls=DecimalEncoder))
+        stream.write("\n")
+        spent += time.perf_counter() - start
+        count += 1
+    METRICS.observe("dump", spent, format="ndjson")
+    return count
+
+
+def dump_json_stream(records, stream=None, compact=False, codec=None):
+    """
+    Write records as one JSON array, record by record. The output is the
+    same as dumpResult(list(records), compact=compact) without holding the
+    list.
+    """
+    stream = stream or sys.stdout
+    count = 0
+    # только кодирование и запись, без получения записей из генератора
+    spent = 0.0
+    if compact:
+        dumps = (codec or default_codec()).dumps
+        for record in records:
+            start = time.perf_counter()
+            stream.write(("[" if not count else ",") + dumps(record))
+            spent += time.perf_counter() - start
+            count += 1
+        stream.write("]" if count else "[]")
+        METRICS.observe("dump", spent, format="json_stream")
+        return count
+
+    for record in records:
+        start = time.perf_counter()
+        if isinstance(record, EstateObject):
+            body = record.to_json(indent=True)
+        else:
+            body = json.dumps(record, indent=4, cls=DecimalEncoder)
+        body = body.replace("\n", "\n    ")
+        stream.write(("[\n    " if not count else ",\n    ") + body)
+        spent += time.perf_counter() - start
+        count += 1
+    stream.write("\n]" if count else "[]")
+    METRICS.observe("dump", spent, format="json_stream")
+    return count
 
 
-def fetch_page(url, **kwargs):
-    page = requests.get(url, **kwargs)
+"""
+Columnar export
+
+"""
+
+# Тип колонки для каждого поля EstateObject; для decimal - (precision, scale)
+EXPORT_SCHEMA = {
+    "complex": "string",
+    "type": "string",
+    "phase": "string",
+    "building": "string",
+    "section": "string",
+    "price_base": ("decimal", 15, 2),
+    "price_finished": ("decimal", 15, 2),
+    "price_sale": ("decimal", 15, 2),
+    "price_finished_sale": ("decimal", 15, 2),
+    "area": ("decimal", 10, 2),
+    "living_area": ("decimal", 10, 2),
+    "number": "string",
+    "number_on_site": "string",
+    # "studio" или число комнат
+    "rooms": "string",
+    "floor": "int",
+    "in_sale": "int",
+    "sale_status": "string",
+    "finished": "int",
+    "currency": "string",
+    "ceil": ("decimal", 6, 2),
+    "article": "string",
+    "finishing_name": "string",
+    "furniture": "int",
+    "furniture_price": "float",
+    "plan": "string",
+    "feature": "list",
+    "view": "list",
+    "euro_planning": "int",
+    "sale": "string",
+    "discount_percent": "float",
+    "discount": ("decimal", 15, 2),
+    "comment": "string",
+    "flat_url": "string",
+    "comissioning": "string",
+    "cession": "int",
+}
+
+
+def _to_decimal(value, exponent):
+    if value is None:
+        return None
+    if value.__class__ is not Decimal:
+        value = Decimal(str(value))
+    return value.quantize(exponent)
+
+
+def _to_list(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [value]
+    return [str(item) for item in value]
+
+
+def _to_string(value):
+    if value is None or value.__class__ is str:
+        return value
+    if isinstance(value, list):
+        return "; ".join(value)
+    return str(value)
+
+
+def _column_converter(kind):
+    """Function converting a column of raw field values to the export type."""
+    if isinstance(kind, tuple):
+        exponent = Decimal(1).scaleb(-kind[2])
+        return lambda values: [_to_decimal(value, exponent) for value in values]
+    if kind == "int":
+        return lambda values: [None if value is None else int(value) for value in values]
+    if kind == "float":
+        return lambda values: [None if value is None else float(value) for value in values]
+    if kind == "list":
+        return lambda values: [_to_list(value) for value in values]
+    return lambda values: [_to_string(value) for value in values]
+
+
+EXPORT_CONVERTERS = {field: _column_converter(kind) for field, kind in EXPORT_SCHEMA.items()}
+
+
+class ColumnarExporter(object):
+    """
+    Buffers records column by column and hands every `batch_size` of them
+    to write_batch(), so an export never holds more than one batch.
+    """
+
+    format = None
+
+    def __init__(self, batch_size=10000):
+        self.batch_size = batch_size
+        self.count = 0
+        self._reset()
+
+    def _reset(self):
+        self._columns = {field: [] for field in EstateObject.FIELDS}
+        self._appenders = [self._columns[field].append for field in EstateObject.FIELDS]
+        self._buffered = 0
+
+    def add(self, record):
+        for append, field in zip(self._appenders, EstateObject.FIELDS):
+            append(getattr(record, field))
+        self._buffered += 1
+        self.count += 1
+        if self._buffered >= self.batch_size:
+            self.flush()
+
+    def export(self, records):
+        """Write all `records` and close the exporter. Returns the count."""
+        # только буферизация, конвертация и запись, без получения записей
+        spent = 0.0
+        try:
+            for record in records:
+                start = time.perf_counter()
+                self.add(record)
+                spent += time.perf_counter() - start
+        finally:
+            start = time.perf_counter()
+            self.close()
+            spent += time.perf_counter() - start
+        METRICS.observe("dump", spent, format=self.format)
+        return self.count
+
+    def flush(self):
+        if self._buffered:
+            columns = {field: EXPORT_CONVERTERS[field](values) for field, values in self._columns.items()}
+            self.write_batch(columns)
+            self._reset()
+
+    def write_batch(self, columns):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CsvExporter(ColumnarExporter):
+    """
+    CSV with a header row; needs no extra packages. Decimals are written
+    with their column scale, lists joined with "; ", None as an empty cell.
+    """
+
+    format = "csv"
+
+    def __init__(self, stream, batch_size=10000):
+        super().__init__(batch_size)
+        self.writer = csv.writer(stream)
+        self.writer.writerow(EstateObject.FIELDS)
+
+    def write_batch(self, columns):
+        columns = [
+            ["; ".join(value) if value is not None else None for value in values]
+            if EXPORT_SCHEMA[field] == "list"
+            else values
+            for field, values in columns.items()
+        ]
+        self.writer.writerows(zip(*columns))
+
+
+class ArrowExporter(ColumnarExporter):
+    """
+    Arrow IPC file or Parquet file through pyarrow (an optional dependency,
+    imported here). Prices and areas are decimal128 columns.
+    """
+
+    def __init__(self, path, format="parquet", batch_size=10000, compression="zstd"):
+        import pyarrow
+
+        super().__init__(batch_size)
+        self.pa = pyarrow
+        self.format = format
+        self.schema = pyarrow.schema(
+            [pyarrow.field(field, self.arrow_type(EXPORT_SCHEMA[field])) for field in EstateObject.FIELDS]
+        )
+        if format == "parquet":
+            import pyarrow.parquet
+
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression=compression)
+        elif format == "arrow":
+            self.writer = pyarrow.ipc.new_file(path, self.schema)
+        else:
+            raise ValueError(f"Unknown Arrow format {format}")
+
+    def arrow_type(self, kind):
+        if isinstance(kind, tuple):
+            return self.pa.decimal128(kind[1], kind[2])
+        return {
+            "string": self.pa.string(),
+            "int": self.pa.int64(),
+            "float": self.pa.float64(),
+            "list": self.pa.list_(self.pa.string()),
+        }[kind]
+
+    def write_batch(self, columns):
+        arrays = [
+            self.pa.array(columns[field.name], type=field.type) for field in self.schema
+        ]
+        batch = self.pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self.format == "parquet":
+            self.writer.write_table(self.pa.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+
+    def close(self):
+        if self.writer is not None:
+            super().close()
+            self.writer.close()
+            self.writer = None
+
+
+EXPORT_FORMATS = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow", ".csv": "csv"}
+
+
+def export_records(records, path, format=None, batch_size=10000):
+    """
+    Stream `records` into a columnar file. The format comes from the path
+    extension unless given; parquet and arrow need pyarrow.
+    """
+    format = format or EXPORT_FORMATS.get(os.path.splitext(path)[1].lower(), "csv")
+    if format == "csv":
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            return CsvExporter(f, batch_size).export(records)
+    return ArrowExporter(path, format, batch_size).export(records)
+
+
+def make_session(pool_size=10):
+    """requests.Session with a keep-alive connection pool of `pool_size`."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_page(url, session=None, **kwargs):
+    page = (session or requests).get(url, **kwargs)
     # raise exception if resource unavailable else continues
     if not page.raise_for_status():
         return page
 
 
 class Profitbase(object):
-    def __init__(self, profitbase_id, host, api_version=4):
+    def __init__(
+        self, profitbase_id, host, api_version=4, base_url=None, session=None, limiter=None, cache=None
+    ):
         self.profitbase_id = profitbase_id
         self.host = host
         self.api_version = api_version
+        # Переопределение адреса API (локальный мок, прокси)
+        self.base_url = base_url
+        # Общий requests.Session; без него каждый запрос открывает новое соединение
+        self.session = session
+        # Ограничитель одновременных запросов к хосту (например, BoundedSemaphore)
+        self.limiter = limiter
+        # TokenManager; если задан, подставляет актуальный токен во все запросы
+        self.tokens = None
+        # ResponseCache для GET-запросов
+        self.cache = cache
+        # TokenBucket арендатора; замедляется после 429/5xx
+        self.rate_limiter = None
+        # Повторы запроса после 429/5xx
+        self.max_retries = 3
+        # Тип объекта -> класс парсера; объекты урезаются до его RAW_FIELDS
+        self.projection = None
+        # Не запрашивать full=true для типов, парсерам которых он не нужен
+        self.slim = False
+
+    @property
+    def api_host(self):
+        return f"{self.profitbase_id}.profitbase.ru"
+
+    def _send(self, method, url, **kwargs):
+        if method == "GET" and self.cache is not None:
+            return self.cache.request(self, url, **kwargs)
+        return self._send_live(method, url, **kwargs)
+
+    def _send_live(self, method, url, **kwargs):
+        params = kwargs.get("params")
+        if self.tokens and params and "access_token" in params:
+            params = kwargs["params"] = dict(params, access_token=self.tokens.get(self))
+
+        res = self._request(method, url, **kwargs)
+        if res.status_code == 401 and self.tokens and params and "access_token" in params:
+            # токен отозван раньше срока - обновляем один раз для всех потоков
+            METRICS.inc("retries", reason="unauthorized")
+            token = self.tokens.refresh(self, stale=params["access_token"])
+            kwargs["params"] = dict(params, access_token=token)
+            res = self._request(method, url, **kwargs)
+
+        if method == "GET":
+            res.raise_for_status()
+        return res
+
+    def _request(self, method, url, **kwargs):
+        endpoint = url.rstrip("/").rsplit("/", 1)[-1]
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            with self.limiter or nullcontext():
+                with METRICS.span("http_request", endpoint=endpoint):
+                    res = (self.session or requests).request(method, url, **kwargs)
+            METRICS.inc("http_responses", endpoint=endpoint, status=res.status_code)
+
+            if res.status_code != 429 and res.status_code < 500:
+                if self.rate_limiter:
+                    self.rate_limiter.reward()
+                return res
+            if attempt == self.max_retries:
+                return res
+
+            METRICS.inc("retries", reason=str(res.status_code))
+            delay = retry_after(res) or random.uniform(0, min(30, 0.5 * 2 ** attempt))
+            if self.rate_limiter:
+                self.rate_limiter.penalize(delay)
+            else:
+                time.sleep(delay)
+        return res
+
+    def api_url(self, endpoint, scheme="https", api_version=None):
+        version = api_version or self.api_version
+        base = self.base_url or f"{scheme}://{self.profitbase_id}.profitbase.ru"
+        return f"{base.rstrip('/')}/api/v{version}/json/{endpoint}"
 
     def update_token(self):
-        url = f"https://{self.profitbase_id}.profitbase.ru/api/v{self.api_version}/json/authentication"
+        return self.authenticate().get("access_token")
+
+    def authenticate(self):
+        """Raw /authentication response: access_token and, if sent, its lifetime."""
+        url = self.api_url("authentication")
         payload = {
             "type": "external-site-widget",
             "credentials": {"referrer": self.host, "referer": self.host},
@@ -450,13 +1602,173 @@ class Profitbase(object):
             "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
         }
 
-        res = requests.post(url, data=json.dumps(payload), headers=headers)
-        if 'access_token' not in res.json():
+        res = self._send("POST", url, data=json.dumps(payload), headers=headers)
+        return res.json()
+
+    def get_estate(self, token, prop_type, page_limit=100, concurrency=None, **additional_params):
+        """
+        Download every page of `prop_type` objects.
+
+        With `concurrency` > 1 the first page is fetched alone to learn
+        `filteredCount`, then the remaining offsets are requested in parallel
+        with at most `concurrency` requests in flight. Pages are concatenated
+        in offset order, so the `order[property_id]` ordering is preserved.
+        """
+        result = []
+        for properties in self.iter_estate_pages(
+            token, prop_type, page_limit, concurrency, **additional_params
+        ):
+            result += properties
+        return result
+
+    def get_estate_checkpointed(
+        self,
+        token,
+        prop_type,
+        checkpoint,
+        page_limit=100,
+        concurrency=None,
+        retries=2,
+        **additional_params,
+    ):
+        """
+        get_estate that survives failed pages. Every page is stored in the
+        `checkpoint` as it arrives, and pages already there are not fetched
+        again. A page that fails is recorded and, once the others are done,
+        retried on its own up to `retries` more times. Pages that still fail
+        are left out of the result and stay recorded for the next run.
+        """
+        if isinstance(page_limit, AdaptivePager):
+            # возобновление опирается на постоянную сетку смещений
+            page_limit = page_limit.limit
+        url, params, headers = self.estate_request(token, prop_type, page_limit, **additional_params)
+
+        def fetch(offset):
+            try:
+                return self.fetch_estate_page(url, dict(params, offset=offset), headers)
+            except Exception as e:
+                logging.warning(f"Page {prop_type} offset={offset} failed: {e}")
+                METRICS.inc("failed_pages", prop_type=prop_type)
+                checkpoint.fail_page(prop_type, offset, e)
+
+        def fetch_offset(offset):
+            page = fetch(offset)
+            if page is not None:
+                checkpoint.save_page(prop_type, offset, page["data"]["properties"])
+
+        def backoff(attempt):
+            time.sleep(random.uniform(0, min(30, 0.5 * 2 ** attempt)))
+
+        known = checkpoint.total(prop_type)
+        if known and known[1] == page_limit:
+            total_count = known[0]
+        else:
+            # первая страница нужна ради filteredCount, и повторяется так же
+            for attempt in range(retries + 1):
+                if attempt:
+                    backoff(attempt)
+                page = fetch(0)
+                if page is not None:
+                    break
+            else:
+                return []
+            total_count = int(page["data"]["filteredCount"])
+            checkpoint.set_total(prop_type, total_count, page_limit)
+            checkpoint.save_page(prop_type, 0, page["data"]["properties"])
+        offsets = range(0, total_count, page_limit)
+
+        for attempt in range(retries + 1):
+            done = checkpoint.offsets(prop_type)
+            missing = [offset for offset in offsets if offset not in done]
+            if not missing:
+                break
+            if attempt:
+                logging.info(f"Retrying {len(missing)} failed {prop_type} pages")
+                backoff(attempt)
+            if concurrency and concurrency > 1:
+                for _ in ordered_map(fetch_offset, missing, concurrency):
+                    pass
+            else:
+                for offset in missing:
+                    fetch_offset(offset)
+
+        result = []
+        for offset in offsets:
+            result += checkpoint.page(prop_type, offset) or []
+        return result
+
+    def iter_estate(self, token, prop_type, page_limit=100, concurrency=None, **additional_params):
+        """Same objects as get_estate, yielded one by one as pages arrive."""
+        for properties in self.iter_estate_pages(
+            token, prop_type, page_limit, concurrency, **additional_params
+        ):
+            yield from properties
+
+    def iter_estate_pages(self, token, prop_type, page_limit=100, concurrency=None, **additional_params):
+        """
+        Yield pages of `prop_type` objects. `page_limit` is a page size or an
+        AdaptivePager, which pages sequentially and resizes every request.
+        """
+        if isinstance(page_limit, AdaptivePager):
+            yield from self._iter_adaptive_pages(token, prop_type, page_limit, **additional_params)
             return
-        return res.json()["access_token"]
 
-    def get_estate(self, token, prop_type, page_limit=100, **additional_params):
-        url = f"http://{self.profitbase_id}.profitbase.ru/api/v{self.api_version}/json/property"
+        url, params, headers = self.estate_request(token, prop_type, page_limit, **additional_params)
+
+        res = self.fetch_estate_page(url, params, headers)
+        total_count = int(res["data"]["filteredCount"])
+        properties = res["data"]["properties"]
+        yield properties
+
+        if concurrency and concurrency > 1:
+
+            def fetch_offset(offset):
+                page = self.fetch_estate_page(url, dict(params, offset=offset), headers)
+                return page["data"]["properties"]
+
+            offsets = self.remaining_offsets(params, total_count)
+            yield from ordered_map(fetch_offset, offsets, concurrency)
+            return
+
+        fetched = len(properties)
+        while properties and fetched < total_count:
+            params["offset"] += page_limit
+            res = self.fetch_estate_page(url, params, headers)
+            total_count = int(res["data"]["filteredCount"])
+            properties = res["data"]["properties"]
+            fetched += len(properties)
+            yield properties
+
+    def _iter_adaptive_pages(self, token, prop_type, pager, **additional_params):
+        url, params, headers = self.estate_request(token, prop_type, pager.limit, **additional_params)
+        fetched = 0
+        total_count = None
+        timeouts = 0
+        while total_count is None or fetched < total_count:
+            params["limit"] = pager.limit
+            start = time.perf_counter()
+            try:
+                res = self._send("GET", url, params=params, headers=headers, timeout=pager.timeout)
+            except requests.Timeout:
+                timeouts += 1
+                METRICS.inc("retries", reason="timeout")
+                if timeouts > self.max_retries or pager.limit == pager.min_limit:
+                    raise
+                pager.shrink()
+                continue
+            pager.update(time.perf_counter() - start, len(res.content))
+
+            data = self.estate_page(res, params)["data"]
+            total_count = int(data["filteredCount"])
+            properties = data["properties"]
+            yield properties
+            if not properties:
+                return
+            fetched += len(properties)
+            params["offset"] += len(properties)
+
+    def estate_request(self, token, prop_type, page_limit=100, **additional_params):
+        url = self.api_url("property", scheme="http")
         params = {
             "propertyTypeAliases[0]": prop_type,
             "isHouseFinished": "0",
@@ -468,6 +1780,9 @@ class Profitbase(object):
             "full": "true",
             "returnFilteredCount": "true",
         }
+        parser_class = (self.projection or {}).get(prop_type)
+        if self.slim and parser_class is not None and not parser_class.FULL_PAYLOAD:
+            del params["full"]
 
         headers = {
             "Host": f"{self.profitbase_id}.profitbase.ru",
@@ -487,24 +1802,33 @@ class Profitbase(object):
         for k, v in additional_params.items():
             params[k] = v
 
-        result = []
-        next_page = True
-
-        while next_page:
-            res = fetch_page(url, params=params, headers=headers).json()
-            total_count = int(res["data"]["filteredCount"])
-            result += res["data"]["properties"]
-            params["offset"] += page_limit
-            next_page = len(result) < total_count
+        return url, params, headers
+
+    def fetch_estate_page(self, url, params, headers):
+        return self.estate_page(self._send("GET", url, params=params, headers=headers), params)
+
+    def estate_page(self, res, params):
+        """Decode a /property response, trimming objects to the projection."""
+        page = default_codec().loads(res.content)
+        prop_type = params.get("propertyTypeAliases[0]")
+        properties = page["data"]["properties"]
+        parser_class = (self.projection or {}).get(prop_type)
+        if parser_class is not None:
+            page["data"]["properties"] = properties = list(map(parser_class.trim, properties))
+        METRICS.inc("pages", prop_type=prop_type)
+        METRICS.inc("records", len(properties), prop_type=prop_type)
+        return page
 
-        return result
+    def remaining_offsets(self, params, total_count):
+        page_limit = params["limit"]
+        return range(params["offset"] + page_limit, total_count, page_limit)
 
     def format_comission(self, quarter, year):
         kv = {1: "I", 2: "II", 3: "III", 4: "IV"}[quarter]
         return f"{kv} кв {year}"
 
     def get_house_comissions(self, token):
-        url = f"https://{self.profitbase_id}.profitbase.ru/api/v4/json/house"
+        url = self.api_url("house", api_version=4)
         params = {"access_token": token}
 
         headers = {
@@ -521,9 +1845,13 @@ class Profitbase(object):
             "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
         }
 
-        res = fetch_page(url, params=params).json()
+        res = self._send("GET", url, params=params).json()
+        return self.house_comissions(res["data"])
+
+    def house_comissions(self, houses):
+        """{house id: comission} from the `data` of a /house response."""
         comissions = {}
-        for house in res["data"]:
+        for house in houses:
             state = house["buildingState"]
             end = house["developmentEndQuarter"]
             value = None
@@ -535,6 +1863,498 @@ class Profitbase(object):
         return comissions
 
 
+class AsyncProfitbase(object):
+    """
+    asyncio client for Profitbase.
+
+    All requests go through one pooled keep-alive requests.Session. requests
+    is blocking, so every call runs on a thread pool sized to the connection
+    pool and the coroutines only coordinate them. The synchronous
+    `Profitbase` client that does the actual work is available as `.sync`.
+    """
+
+    def __init__(self, profitbase_id, host, api_version=4, base_url=None, pool_size=10, cache=None):
+        self.pool_size = pool_size
+        self.session = make_session(pool_size)
+        self.sync = Profitbase(
+            profitbase_id, host, api_version, base_url, session=self.session, cache=cache
+        )
+        self._executor = ThreadPoolExecutor(max_workers=pool_size)
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def update_token(self):
+        return await self._run(self.sync.update_token)
+
+    async def get_token(self):
+        return await self._run(get_token, self.sync)
+
+    async def get_house_comissions(self, token):
+        return await self._run(self.sync.get_house_comissions, token)
+
+    async def get_estate(self, token, prop_type, page_limit=100, concurrency=None, **additional_params):
+        if isinstance(page_limit, AdaptivePager):
+            # адаптивный размер страницы возможен только при последовательном обходе
+            return await self._run(self.sync.get_estate, token, prop_type, page_limit, **additional_params)
+        url, params, headers = self.sync.estate_request(token, prop_type, page_limit, **additional_params)
+        res = await self._run(self.sync.fetch_estate_page, url, params, headers)
+        total_count = int(res["data"]["filteredCount"])
+        result = res["data"]["properties"]
+
+        semaphore = asyncio.Semaphore(concurrency or self.pool_size)
+
+        async def fetch_offset(offset):
+            async with semaphore:
+                page = await self._run(
+                    self.sync.fetch_estate_page, url, dict(params, offset=offset), headers
+                )
+            return page["data"]["properties"]
+
+        offsets = self.sync.remaining_offsets(params, total_count)
+        for properties in await asyncio.gather(*map(fetch_offset, offsets)):
+            result += properties
+        return result
+
+    async def get_all(self, token, prop_types, concurrency=None, page_limit=100, checkpoint=None):
+        """
+        Fetch the house comissions and every property type at the same time.
+        Returns (comissions, {prop_type: properties}). A callable `page_limit`
+        is called once per property type (e.g. to build an AdaptivePager each).
+        With a `checkpoint` pages go through get_estate_checkpointed.
+        """
+
+        def fetch(prop_type):
+            limit = page_limit() if callable(page_limit) else page_limit
+            if checkpoint is not None:
+                return self._run(
+                    self.sync.get_estate_checkpointed, token, prop_type, checkpoint, limit, concurrency
+                )
+            return self.get_estate(token, prop_type, limit, concurrency=concurrency)
+
+        comissions, *estates = await asyncio.gather(
+            self.get_house_comissions(token), *map(fetch, prop_types)
+        )
+        return comissions, dict(zip(prop_types, estates))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+
+"""
+Tokens
+
+"""
+
+
+CACHE_DIR = os.environ.get(
+    "PROFITBASE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "profitbase")
+)
+
+
+class TokenManager(object):
+    """
+    Access token of one tenant, cached in memory and on disk until it expires.
+
+    The token is refreshed `refresh_margin` seconds before expiry or when a
+    request comes back with 401. Failed authentications are retried with
+    exponential backoff and full jitter. One manager is shared by every
+    thread of the tenant, so concurrent fetches trigger a single refresh.
+    The manager holds no client: get() and refresh() authenticate through
+    the Profitbase client that asks, with its own session and limits.
+    Tokens of an overridden API address (a mock, a fixture stub) are cached
+    in a file of their own, readable by the owner only.
+    """
+
+    _managers = {}
+    _managers_lock = threading.Lock()
+
+    def __init__(
+        self,
+        profitbase_id,
+        base_url=None,
+        cache_dir=CACHE_DIR,
+        default_ttl=3600,
+        refresh_margin=60,
+        max_attempts=6,
+        backoff_base=0.5,
+        backoff_cap=30,
+    ):
+        self.profitbase_id = profitbase_id
+        name = profitbase_id
+        if base_url:
+            name += "-" + hashlib.sha1(base_url.encode("utf-8")).hexdigest()[:12]
+        self.path = os.path.join(cache_dir, f"{name}.token.json") if cache_dir else None
+        # Время жизни токена, если /authentication его не вернул
+        self.default_ttl = default_ttl
+        self.refresh_margin = refresh_margin
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.token = None
+        self.expires_at = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def for_client(cls, pb, **kwargs):
+        """Manager shared by all clients of the same tenant in this process."""
+        key = (pb.profitbase_id, pb.host, pb.base_url)
+        with cls._managers_lock:
+            if key not in cls._managers:
+                cls._managers[key] = cls(pb.profitbase_id, pb.base_url, **kwargs)
+            return cls._managers[key]
+
+    def get(self, pb):
+        with self._lock:
+            if not self.token or time.time() >= self.expires_at - self.refresh_margin:
+                self._refresh(pb)
+            return self.token
+
+    def refresh(self, pb, stale=None):
+        """
+        Force a new token. With `stale` the refresh is skipped if another
+        thread has already replaced that token.
+        """
+        with self._lock:
+            if stale is None or self.token in (None, stale):
+                self._refresh(pb)
+            return self.token
+
+    def _refresh(self, pb):
+        for attempt in range(self.max_attempts):
+            try:
+                auth = pb.authenticate()
+            except (requests.RequestException, ValueError) as e:
+                logging.warning(f"{self.profitbase_id}: authentication failed: {e}")
+                auth = {}
+            if auth.get("access_token"):
+                self.token = auth["access_token"]
+                ttl = auth.get("remaining_time") or self.default_ttl
+                self.expires_at = time.time() + int(ttl)
+                self._save()
+                METRICS.inc("token_refreshes")
+                return
+            METRICS.inc("retries", reason="authentication")
+            delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+            time.sleep(delay)
+        raise Exception(f"{self.profitbase_id}: no access_token after {self.max_attempts} attempts")
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                cached = json.load(f)
+            self.token = cached["access_token"]
+            self.expires_at = cached["expires_at"]
+        except (ValueError, KeyError, OSError) as e:
+            logging.warning(f"Ignoring token cache {self.path}: {e}")
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"access_token": self.token, "expires_at": self.expires_at}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Cannot write token cache {self.path}: {e}")
+
+
+"""
+Response cache
+
+"""
+
+
+OFFLINE_TOKEN = "offline"
+
+# Сколько секунд ответ endpoint'а считается свежим без обращения к API
+CACHE_TTLS = {"house": 6 * 3600, "property": 300}
+
+
+class CacheMiss(Exception):
+    pass
+
+
+class CachedResponse(object):
+    """The subset of requests.Response the client reads, served from a cache entry."""
+
+    status_code = 200
+
+    def __init__(self, entry):
+        self.content = entry["body"]
+        self.headers = {}
+        if entry.get("etag"):
+            self.headers["ETag"] = entry["etag"]
+        if entry.get("last_modified"):
+            self.headers["Last-Modified"] = entry["last_modified"]
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return default_codec().loads(self.content)
+
+    def raise_for_status(self):
+        pass
+
+
+class SQLiteStore(object):
+    """Cache entries in one SQLite file; safe to share between threads."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, body BLOB, etag TEXT, last_modified TEXT, stored_at REAL)"
+        )
+        self._db.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, etag, last_modified, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row:
+            return dict(zip(("body", "etag", "last_modified", "stored_at"), row))
+
+    def set(self, key, entry):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, entry["body"], entry.get("etag"), entry.get("last_modified"), entry["stored_at"]),
+            )
+            self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+class FileStore(object):
+    """Cache entries as one JSON file per key in a directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        entry["body"] = entry["body"].encode("utf-8")
+        return entry
+
+    def set(self, key, entry):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(dict(entry, key=key, body=entry["body"].decode("utf-8")), f)
+        os.replace(tmp_path, path)
+
+    def close(self):
+        pass
+
+
+class ResponseCache(object):
+    """
+    GET response cache keyed by tenant, endpoint and query params (without
+    the access token).
+
+    An entry younger than its endpoint TTL is served without touching the
+    network. Older entries are revalidated with If-None-Match /
+    If-Modified-Since when the server sent ETag / Last-Modified, otherwise
+    refetched. With `offline` only cached payloads are served and a miss
+    raises CacheMiss.
+    """
+
+    def __init__(self, store, ttls=None, offline=False):
+        self.store = store
+        self.ttls = dict(CACHE_TTLS, **(ttls or {}))
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    @classmethod
+    def open(cls, path, **kwargs):
+        """SQLite store for *.sqlite/*.db paths, a file store directory otherwise."""
+        if path.endswith((".sqlite", ".sqlite3", ".db")):
+            return cls(SQLiteStore(path), **kwargs)
+        return cls(FileStore(path), **kwargs)
+
+    def key(self, tenant, endpoint, params):
+        query = sorted((k, str(v)) for k, v in (params or {}).items() if k != "access_token")
+        return f"{tenant}/{endpoint}?{urlencode(query)}"
+
+    def request(self, pb, url, params=None, headers=None, **kwargs):
+        endpoint = urlparse(url).path.rstrip("/").rsplit("/", 1)[-1]
+        key = self.key(pb.profitbase_id, endpoint, params)
+        entry = self.store.get(key)
+
+        if entry and (self.offline or time.time() - entry["stored_at"] < self.ttls.get(endpoint, 0)):
+            self.hits += 1
+            METRICS.inc("cache_hits", endpoint=endpoint)
+            return CachedResponse(entry)
+        if self.offline:
+            raise CacheMiss(key)
+
+        headers = dict(headers or {})
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        res = pb._send_live("GET", url, params=params, headers=headers, **kwargs)
+
+        if res.status_code == 304 and entry:
+            self.revalidated += 1
+            METRICS.inc("cache_revalidated", endpoint=endpoint)
+            entry["stored_at"] = time.time()
+            self.store.set(key, entry)
+            return CachedResponse(entry)
+
+        self.misses += 1
+        self.store.set(
+            key,
+            {
+                "body": res.content,
+                "etag": res.headers.get("ETag"),
+                "last_modified": res.headers.get("Last-Modified"),
+                "stored_at": time.time(),
+            },
+        )
+        return res
+
+    def close(self):
+        self.store.close()
+
+
+"""
+Paging & rate control
+
+"""
+
+
+def retry_after(res):
+    """Retry-After of a response in seconds, if given as a number."""
+    value = res.headers.get("Retry-After")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class AdaptivePager(object):
+    """
+    Page size for get_estate that follows the measured cost of each page.
+
+    After every page the limit is rescaled so that a page takes about
+    `target_seconds`, by at most x2 per step, within [min_limit, max_limit],
+    and is halved when a page exceeds `max_bytes` or times out.
+    """
+
+    def __init__(
+        self,
+        limit=100,
+        min_limit=50,
+        max_limit=1000,
+        target_seconds=2.0,
+        max_bytes=8 * 2 ** 20,
+        timeout=30,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = min(max(limit, min_limit), max_limit)
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+        # Таймаут одного запроса страницы, сек
+        self.timeout = timeout
+
+    def update(self, seconds, size):
+        if size > self.max_bytes:
+            self.shrink()
+            return
+        factor = self.target_seconds / max(seconds, 1e-3)
+        factor = min(max(factor, 0.5), 2.0, self.max_bytes / max(size, 1))
+        self.limit = int(min(max(self.limit * factor, self.min_limit), self.max_limit))
+
+    def shrink(self):
+        self.limit = max(self.limit // 2, self.min_limit)
+
+
+class TokenBucket(object):
+    """
+    Token-bucket rate limiter: `rate` requests per second with bursts of up
+    to `capacity`. penalize() halves the rate (down to `min_rate`) and
+    pauses the bucket, reward() restores it gradually.
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=0.2):
+        self.max_rate = self.rate = float(rate)
+        self.min_rate = min(min_rate, self.max_rate)
+        self.capacity = capacity or max(1.0, self.max_rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def penalize(self, pause=None):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            if pause:
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+
+    def reward(self):
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def rate_limiter_for(profitbase_id, rate):
+    """TokenBucket shared by every client of `profitbase_id` in this process."""
+    with _rate_limiters_lock:
+        if profitbase_id not in _rate_limiters:
+            _rate_limiters[profitbase_id] = TokenBucket(rate)
+        return _rate_limiters[profitbase_id]
+
+
 def has_price(estate_obj):
     return (
         estate_obj["price_base"]
@@ -544,28 +2364,1423 @@ def has_price(estate_obj):
     )
 
 
-def get_data():
-    pb = Profitbase("pb13246", "https://anapolisdom.ru/")
-    token = pb.update_token()
-    if not token:
-        while not token:
-            token = pb.update_token()
-    comissions = pb.get_house_comissions(token)
-    host = "https://anapolisdom.ru/"
+PARSERS = {
+    "property": ApartmentParser,
+    "commercial_premises": CommercialParser,
+    "pantry": ParkingParser,
+}
+
+
+def parser_class(name):
+    """BaseParser subclass by class name, e.g. for a tenants config."""
+    classes = {}
+    pending = [BaseParser]
+    while pending:
+        for subclass in pending.pop().__subclasses__():
+            classes[subclass.__name__] = subclass
+            pending.append(subclass)
+    if name not in classes:
+        raise ValueError(f"Unknown parser class {name}, expected one of {', '.join(sorted(classes))}")
+    return classes[name]
+
+
+"""
+Tenants
+
+"""
+
+
+class Tenant(object):
+    def __init__(
+        self,
+        profitbase_id,
+        host,
+        region,
+        parsers=None,
+        name=None,
+        base_url=None,
+        rate_limit=None,
+        page_limit=100,
+        projection="trim",
+    ):
+        self.profitbase_id = profitbase_id
+        # Сайт застройщика, от имени которого запрашивается токен
+        self.host = host
+        self.region = region
+        # Тип объекта Profitbase -> класс парсера
+        self.parsers = dict(parsers or PARSERS)
+        self.name = name or profitbase_id
+        self.base_url = base_url
+        # Запросов в секунду к API арендатора
+        self.rate_limit = rate_limit
+        # Размер страницы: число, или dict с параметрами AdaptivePager
+        self.page_limit = page_limit
+        # "full" - объекты как есть, "trim" - урезать до полей парсера,
+        # "slim" - вдобавок не запрашивать full=true, где он не нужен
+        self.projection = projection
+
+    def make_page_limit(self):
+        if isinstance(self.page_limit, dict):
+            return AdaptivePager(**self.page_limit)
+        return self.page_limit
+
+    def record_types(self):
+        """EstateObject.type of every record the tenant's parsers produce, None if unknown."""
+        types = {parser_class.TYPE for parser_class in self.parsers.values()}
+        return None if None in types else types
+
+    def configure(self, pb):
+        """Attach the tenant's request limits and projection to a Profitbase client."""
+        if self.rate_limit:
+            pb.rate_limiter = rate_limiter_for(self.profitbase_id, self.rate_limit)
+        if self.projection != "full":
+            pb.projection = self.parsers
+            pb.slim = self.projection == "slim"
+        return pb
+
+    @classmethod
+    def from_dict(cls, config):
+        """
+        Build a tenant from a config entry. `parsers` is either a list of
+        property type aliases handled by the default parsers, or a mapping
+        alias -> parser class name.
+        """
+        parsers = config.get("parsers")
+        if isinstance(parsers, dict):
+            parsers = {alias: parser_class(name) for alias, name in parsers.items()}
+        elif parsers:
+            parsers = {alias: PARSERS[alias] for alias in parsers}
+        return cls(
+            config["profitbase_id"],
+            config["host"],
+            config["region"],
+            parsers=parsers,
+            name=config.get("name"),
+            base_url=config.get("base_url"),
+            rate_limit=config.get("rate_limit"),
+            page_limit=config.get("page_limit", 100),
+            projection=config.get("projection", "trim"),
+        )
+
+
+def load_tenants(path):
+    with open(path, encoding="utf-8") as f:
+        return [Tenant.from_dict(entry) for entry in json.load(f)]
+
+
+ANAPOLISDOM = Tenant("pb13246", "https://anapolisdom.ru/", "Анапа")
+
+
+def get_token(pb):
+    """Cached token of `pb`'s tenant, attaching a TokenManager on first use."""
+    if pb.cache is not None and pb.cache.offline:
+        # ключ кэша не зависит от токена, в сеть не ходим
+        return OFFLINE_TOKEN
+    if pb.tokens is None:
+        pb.tokens = TokenManager.for_client(pb)
+    return pb.tokens.get(pb)
+
+
+async def fetch_estates(pb, prop_types, concurrency=None, page_limit=100, checkpoint=None):
+    token = await pb.get_token()
+    return await pb.get_all(token, prop_types, concurrency, page_limit, checkpoint)
+
+
+def run_coroutine(coro):
+    """
+    asyncio.run(coro) for synchronous callers. Inside a running event loop
+    the coroutine gets its own loop on a helper thread, since asyncio.run
+    cannot be nested.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+def make_parsers(tenant, comissions):
+    return {
+        prop_type: parser_class(tenant.host, comissions, tenant.region)
+        for prop_type, parser_class in tenant.parsers.items()
+    }
+
+
+def parse_estates(tenant, comissions, estates, processes=None, parsers=None, quarantine=None):
+    """
+    Priced records of every property type. With a `quarantine` records that
+    fail to parse are set aside there instead of failing the whole run.
+    """
     data = []
+    parsers = parsers or make_parsers(tenant, comissions)
+    with ParsePool(parsers, processes, records=estates) if processes else nullcontext() as pool:
+        for prop_type, parser in parsers.items():
+            on_error = quarantine.handler(tenant, prop_type) if quarantine is not None else None
+            with METRICS.span("parse", prop_type=prop_type):
+                if pool:
+                    parsed = pool.parse(prop_type, estates[prop_type], on_error)
+                elif on_error:
+                    parsed = parser.parse_page_isolated(estates[prop_type], on_error)
+                else:
+                    parsed = parser.parse_page(estates[prop_type])
+            priced = list(filter(lambda e: has_price(e), parsed))
+            METRICS.inc("filtered_out", len(parsed) - len(priced), prop_type=prop_type)
+            data += priced
+    return data
+
+
+def timed_parse(parse_page, pages, prop_type):
+    """Records of parse_page(page) for every page, with the parsing of each page timed."""
+    for page in pages:
+        start = time.perf_counter()
+        records = parse_page(page)
+        METRICS.observe("parse", time.perf_counter() - start, prop_type=prop_type)
+        yield from records
+
+
+def filter_priced(records, prop_type):
+    """filter(has_price, records) that also counts dropped records when metrics are on."""
+    if not METRICS.enabled:
+        return filter(has_price, records)
+    return _count_filtered(records, prop_type)
+
+
+def _count_filtered(records, prop_type):
+    for record in records:
+        if has_price(record):
+            yield record
+        else:
+            METRICS.inc("filtered_out", prop_type=prop_type)
+
+
+"""
+Parallel parsing
+
+"""
+
+
+_worker_parsers = None
+_worker_records = None
+
+
+def _init_parse_worker(parsers, records):
+    global _worker_parsers, _worker_records
+    _worker_parsers = parsers
+    _worker_records = records
+
+
+def _parse_chunk(task):
+    prop_type, chunk = task
+    parser = _worker_parsers[prop_type]
+    if isinstance(chunk, range):
+        chunk = _worker_records[prop_type][chunk.start:chunk.stop]
+    failed = []
+    records = parser.parse_page_isolated(
+        chunk, lambda data, e: failed.append((data, f"{e.__class__.__name__}: {e}"))
+    )
+    parsed = [record.to_tuple() for record in records]
+    feature_rules = getattr(parser, "feature_rules", None)
+    unknown = None
+    if feature_rules and feature_rules.unknown:
+        unknown = dict(feature_rules.unknown)
+        feature_rules.unknown.clear()
+    return parsed, unknown, failed
+
+
+class ParsePool(object):
+    """
+    Parse records on a process pool.
+
+    The parsers (and the comissions map they hold) reach each worker once
+    through the pool initializer, never per task. Where the "fork" start
+    method is available, `records` ({prop_type: list}) already downloaded
+    before the pool starts are inherited by the workers as well, and tasks
+    only carry index ranges; other inputs are sent in chunks. Results come
+    back as plain tuples, which pickle far cheaper than objects, and are
+    yielded in input order. Unknown-feature counts from the workers are
+    merged back into the local parsers.
+    """
+
+    def __init__(self, parsers, workers=None, chunk_size=500, records=None):
+        # модуль процессов тянет за собой multiprocessing, поэтому грузится здесь
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.parsers = parsers
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        context = None
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        self.shared = records if context else None
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_parse_worker,
+            initargs=(parsers, self.shared),
+        )
+
+    def _tasks(self, prop_type, records):
+        if self.shared and self.shared.get(prop_type) is records:
+            for start in range(0, len(records), self.chunk_size):
+                yield prop_type, range(start, min(start + self.chunk_size, len(records)))
+        else:
+            for chunk in chunked(records, self.chunk_size):
+                yield prop_type, chunk
+
+    def iter_parse(self, prop_type, records, on_error=None):
+        """
+        Parsed `records` in input order. Records that fail in a worker go to
+        on_error(data, ParseError); without `on_error` the first one raises.
+        """
+        tasks = self._tasks(prop_type, records)
+        feature_rules = getattr(self.parsers[prop_type], "feature_rules", None)
+        for parsed, unknown, failed in ordered_map(_parse_chunk, tasks, self.workers, self._executor):
+            if unknown and feature_rules:
+                feature_rules.unknown.update(unknown)
+            for data, message in failed:
+                if on_error is None:
+                    raise ParseError(message, data)
+                on_error(data, ParseError(message, data))
+            yield from map(EstateObject.from_tuple, parsed)
+
+    def parse(self, prop_type, records, on_error=None):
+        return list(self.iter_parse(prop_type, records, on_error))
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+"""
+Fault isolation
+
+"""
+
+
+class ParseError(Exception):
+    """A record that failed to parse in a worker process, with its raw payload."""
+
+    def __init__(self, message, data=None):
+        super().__init__(message)
+        self.data = data
+
+
+class Quarantine(object):
+    """
+    Records that failed to parse, set aside with their raw payload and the
+    error. With `path` every entry is also appended to that NDJSON file as
+    it arrives, so the records can be inspected and replayed later.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = []
+        self._lock = threading.Lock()
+
+    def add(self, tenant, prop_type, data, error):
+        entry = {
+            "tenant": getattr(tenant, "name", tenant),
+            "prop_type": prop_type,
+            "id": data.get("id") if isinstance(data, dict) else None,
+            "error": f"{error.__class__.__name__}: {error}",
+            "quarantined_at": time.time(),
+            "payload": data,
+        }
+        logging.error(f"Quarantined {entry['tenant']} {prop_type} {entry['id']}: {entry['error']}")
+        METRICS.inc("quarantined", prop_type=prop_type)
+        with self._lock:
+            self.entries.append(entry)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False, default=str))
+                    f.write("\n")
+
+    def handler(self, tenant, prop_type):
+        """on_error callback for parse_page_isolated and ParsePool."""
+        return lambda data, error: self.add(tenant, prop_type, data, error)
+
+    def ids(self, tenant, since=0):
+        """Property ids of `tenant` quarantined since entry number `since`."""
+        name = getattr(tenant, "name", tenant)
+        with self._lock:
+            entries = self.entries[since:]
+        return {str(e["id"]) for e in entries if e["tenant"] == name and e["id"] is not None}
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class Checkpoint(object):
+    """
+    /property pages of one run stored in a SQLite file as they arrive,
+    together with the pages that failed. A run that stops half way resumes
+    from here and fetches only the missing pages. A checkpoint older than
+    `max_age` seconds is discarded on open.
+    """
+
+    def __init__(self, path, max_age=6 * 3600):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.exists(path) and time.time() - os.path.getmtime(path) > max_age:
+            os.remove(path)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS totals (
+                prop_type TEXT PRIMARY KEY, total INTEGER, page_limit INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                prop_type TEXT, offset INTEGER, body BLOB, PRIMARY KEY (prop_type, offset)
+            );
+            CREATE TABLE IF NOT EXISTS failed (
+                prop_type TEXT, offset INTEGER, error TEXT, attempts INTEGER,
+                PRIMARY KEY (prop_type, offset)
+            );
+            """
+        )
+        self._db.commit()
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._db:
+            return self._db.execute(sql, params).fetchall()
+
+    def total(self, prop_type):
+        """(filteredCount, page_limit) recorded for `prop_type`, or None."""
+        rows = self._execute("SELECT total, page_limit FROM totals WHERE prop_type = ?", (prop_type,))
+        return rows[0] if rows else None
+
+    def set_total(self, prop_type, total, page_limit):
+        self._execute("INSERT OR REPLACE INTO totals VALUES (?, ?, ?)", (prop_type, total, page_limit))
+        self._execute("DELETE FROM pages WHERE prop_type = ?", (prop_type,))
+
+    def offsets(self, prop_type):
+        return {row[0] for row in self._execute("SELECT offset FROM pages WHERE prop_type = ?", (prop_type,))}
+
+    def page(self, prop_type, offset):
+        rows = self._execute("SELECT body FROM pages WHERE prop_type = ? AND offset = ?", (prop_type, offset))
+        return default_codec().loads(rows[0][0]) if rows else None
+
+    def save_page(self, prop_type, offset, properties):
+        body = default_codec().dumps(properties).encode("utf-8")
+        self._execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?)", (prop_type, offset, body))
+        self._execute("DELETE FROM failed WHERE prop_type = ? AND offset = ?", (prop_type, offset))
+
+    def fail_page(self, prop_type, offset, error):
+        self._execute(
+            "INSERT INTO failed VALUES (?, ?, ?, 1) ON CONFLICT (prop_type, offset) "
+            "DO UPDATE SET error = excluded.error, attempts = attempts + 1",
+            (prop_type, offset, f"{error.__class__.__name__}: {error}"),
+        )
+
+    def failed(self):
+        """[(prop_type, offset, error, attempts)] of pages still missing."""
+        return self._execute("SELECT prop_type, offset, error, attempts FROM failed ORDER BY prop_type, offset")
+
+    def clear(self):
+        """Drop the checkpoint once the run it belongs to has completed."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        self._db.close()
+
+
+"""
+Incremental sync
+
+"""
+
+
+def payload_hash(data, comission=None):
+    """Content hash of a raw property plus the house comission it is parsed with."""
+    raw = json.dumps([data, comission], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class Snapshot(object):
+    """
+    Parsed records of the previous run keyed by property id, each stored with
+    the hash of the raw payload it was parsed from.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # "<property type>/<property id>" -> {"id", "hash", "record"}
+        self.entries = {}
+        self.reused = 0
+        self.parsed = 0
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                self.entries = default_codec().loads(f.read(), decimal=True)
+            for entry in self.entries.values():
+                entry["record"] = EstateObject.from_dict(entry["record"])
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, cls=DecimalEncoder, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def parse(self, tenant, comissions, estates, quarantine=None):
+        """
+        Parse only the properties whose payload changed since the snapshot was
+        taken, reuse the stored records for the rest and make the result the
+        new snapshot. Returns the previous entries for diffing. Properties
+        that fail to parse go to `quarantine` when one is given and keep
+        their previous entry, so they are not reported as removed.
+        """
+        previous = self.entries
+        current = {}
+        for prop_type, parser_class in tenant.parsers.items():
+            parser = parser_class(tenant.host, comissions, tenant.region)
+            on_error = quarantine.handler(tenant, prop_type) if quarantine is not None else None
+            with METRICS.span("parse", prop_type=prop_type):
+                for data in estates[prop_type]:
+                    key = f"{prop_type}/{data['id']}"
+                    digest = payload_hash(data, comissions.get(data.get("house_id")))
+                    entry = previous.get(key)
+                    if entry and entry["hash"] == digest:
+                        self.reused += 1
+                        current[key] = entry
+                    else:
+                        self.parsed += 1
+                        try:
+                            record = parser.parse(data)
+                        except Exception as e:
+                            if on_error is None:
+                                raise
+                            on_error(data, e)
+                            if entry:
+                                current[key] = entry
+                            continue
+                        current[key] = {"id": data["id"], "hash": digest, "record": record}
+        self.entries = current
+        logging.info(f"Snapshot {self.path}: {self.parsed} parsed, {self.reused} unchanged")
+        return previous
+
+    def records(self):
+        return [e["record"] for e in self.entries.values() if has_price(e["record"])]
+
+    def changes(self, previous):
+        """Priced records added or changed since `previous`, and ids that left the result."""
+        old = {key for key, e in previous.items() if has_price(e["record"])}
+        added, changed, kept = [], [], set()
+        for key, entry in self.entries.items():
+            if not has_price(entry["record"]):
+                continue
+            kept.add(key)
+            if key not in old:
+                added.append(dict(entry["record"].to_dict(), id=entry["id"]))
+            elif previous[key]["hash"] != entry["hash"]:
+                changed.append(dict(entry["record"].to_dict(), id=entry["id"]))
+        removed = [previous[key]["id"] for key in old - kept]
+        return {"added": added, "changed": changed, "removed": sorted(removed)}
+
+
+"""
+History
+
+"""
+
+PROPERTY_ID_RE = re.compile(r"propertyId=(\d+)")
+
+
+def record_property_id(record):
+    """Profitbase property id of a parsed record, taken from its flat_url."""
+    match = PROPERTY_ID_RE.search(record.flat_url or "")
+    return match.group(1) if match else record.flat_url
+
+
+class HistoryStore(object):
+    """
+    Append-only price and status history in one SQLite file.
+
+    record_run() compares a run's records with the last known state of
+    each property and appends a row only for properties that appeared,
+    changed one of HISTORY_FIELDS, or left the result (a row with
+    `removed` = 1). Unchanged properties cost nothing, so the file grows
+    with the number of changes, not with the number of runs. The `current`
+    table holds the last state per property for that comparison.
+    """
+
+    HISTORY_FIELDS = (
+        "price_base",
+        "price_finished",
+        "price_sale",
+        "price_finished_sale",
+        "sale_status",
+        "in_sale",
+    )
+    # Decimal хранится строкой без лишних нулей, чтобы не терять точность и
+    # чтобы 3507919 и 3507919.0 (после снимка) не считались изменением
+    DECIMAL_COLUMNS = ("price_base", "price_finished", "price_sale", "price_finished_sale")
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        columns = ", ".join(f"{field} {self._column_type(field)}" for field in self.HISTORY_FIELDS)
+        self._db.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS history (
+                tenant TEXT NOT NULL,
+                property_id TEXT NOT NULL,
+                observed_at REAL NOT NULL,
+                type TEXT,
+                {columns},
+                removed INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS history_property
+                ON history (tenant, property_id, observed_at);
+            CREATE INDEX IF NOT EXISTS history_observed
+                ON history (observed_at, tenant);
+            CREATE TABLE IF NOT EXISTS current (
+                tenant TEXT NOT NULL,
+                property_id TEXT NOT NULL,
+                state TEXT NOT NULL,
+                type TEXT,
+                PRIMARY KEY (tenant, property_id)
+            ) WITHOUT ROWID;
+            """
+        )
+        self._db.commit()
+
+    def _column_type(self, field):
+        return "TEXT" if field in self.DECIMAL_COLUMNS or field == "sale_status" else "INTEGER"
+
+    def _state(self, record):
+        values = []
+        for field in self.HISTORY_FIELDS:
+            value = getattr(record, field)
+            if field in self.DECIMAL_COLUMNS and value is not None:
+                if value.__class__ is not Decimal:
+                    value = Decimal(str(value))
+                value = format(value.normalize(), "f")
+            values.append(value)
+        return values
+
+    def record_run(self, tenant, records, observed_at=None, types=None, keep=()):
+        """
+        Append the deltas of one run of `tenant` (its name). Returns the
+        number of added, changed, removed and unchanged properties. With
+        `types` (EstateObject.type values) the run covered only those types,
+        and properties of other types are not marked removed. Property ids
+        in `keep` (e.g. quarantined ones) are not marked removed either.
+        """
+        observed_at = time.time() if observed_at is None else observed_at
+        counts = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+        placeholders = ", ".join("?" * (len(self.HISTORY_FIELDS) + 5))
+        insert = f"INSERT INTO history VALUES ({placeholders})"
+        with self._lock, self._db:
+            previous, previous_types = {}, {}
+            for property_id, state, record_type in self._db.execute(
+                "SELECT property_id, state, type FROM current WHERE tenant = ?", (tenant,)
+            ):
+                previous[property_id] = state
+                previous_types[property_id] = record_type
+            seen = set()
+            for record in records:
+                property_id = record_property_id(record)
+                if property_id in seen:
+                    continue
+                seen.add(property_id)
+                values = self._state(record)
+                state = json.dumps(values, ensure_ascii=False)
+                old = previous.get(property_id)
+                if old == state:
+                    counts["unchanged"] += 1
+                    continue
+                counts["changed" if old is not None else "added"] += 1
+                self._db.execute(insert, (tenant, property_id, observed_at, record.type, *values, 0))
+                self._db.execute(
+                    "INSERT OR REPLACE INTO current VALUES (?, ?, ?, ?)",
+                    (tenant, property_id, state, record.type),
+                )
+            for property_id in previous.keys() - seen:
+                record_type = previous_types[property_id]
+                if property_id in keep or (types is not None and record_type not in types):
+                    continue
+                counts["removed"] += 1
+                empty = [None] * len(self.HISTORY_FIELDS)
+                self._db.execute(insert, (tenant, property_id, observed_at, record_type, *empty, 1))
+                self._db.execute(
+                    "DELETE FROM current WHERE tenant = ? AND property_id = ?", (tenant, property_id)
+                )
+        METRICS.inc("history_rows", counts["added"] + counts["changed"] + counts["removed"], tenant=tenant)
+        return counts
+
+    def _rows(self, sql, params):
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            names = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        result = []
+        for row in rows:
+            row = dict(zip(names, row))
+            for field in self.DECIMAL_COLUMNS:
+                if row.get(field) is not None:
+                    row[field] = Decimal(row[field])
+            row["removed"] = bool(row["removed"])
+            result.append(row)
+        return result
+
+    def changed_since(self, since, tenant=None):
+        """Every change observed after the `since` timestamp, oldest first."""
+        if tenant is None:
+            return self._rows(
+                "SELECT * FROM history WHERE observed_at > ? ORDER BY observed_at, tenant, property_id",
+                (since,),
+            )
+        return self._rows(
+            "SELECT * FROM history WHERE observed_at > ? AND tenant = ? ORDER BY observed_at, property_id",
+            (since, tenant),
+        )
+
+    def price_series(self, tenant, property_id):
+        """The recorded states of one property, oldest first."""
+        return self._rows(
+            "SELECT * FROM history WHERE tenant = ? AND property_id = ? ORDER BY observed_at",
+            (tenant, str(property_id)),
+        )
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def stream_data(tenant=ANAPOLISDOM, concurrency=None, processes=None, cache=None, quarantine=None):
+    """
+    Lazily yield the tenant's priced records page -> parse -> filter, so only
+    the pages in flight are held in memory. Property types are fetched one
+    after another; use get_data to fetch them at the same time. Records
+    that fail to parse go to `quarantine` when one is given.
+    """
+    pb = Profitbase(
+        tenant.profitbase_id, tenant.host, base_url=tenant.base_url, session=make_session(), cache=cache
+    )
+    tenant.configure(pb)
+    pool = None
+    try:
+        token = get_token(pb)
+        comissions = pb.get_house_comissions(token)
+        parsers = make_parsers(tenant, comissions)
+        if processes:
+            pool = ParsePool(parsers, processes)
+        for prop_type, parser in parsers.items():
+            on_error = quarantine.handler(tenant, prop_type) if quarantine is not None else None
+            pages = pb.iter_estate_pages(token, prop_type, tenant.make_page_limit(), concurrency)
+            if pool:
+                records = pool.iter_parse(prop_type, itertools.chain.from_iterable(pages), on_error)
+            elif on_error:
+                records = timed_parse(
+                    functools.partial(parser.parse_page_isolated, on_error=on_error), pages, prop_type
+                )
+            else:
+                records = timed_parse(parser.parse_page, pages, prop_type)
+            yield from filter_priced(records, prop_type)
+    finally:
+        if pool:
+            pool.close()
+        pb.session.close()
+
+
+def get_data(
+    tenant=ANAPOLISDOM,
+    concurrency=None,
+    snapshot_path=None,
+    changes_only=False,
+    processes=None,
+    cache=None,
+    history=None,
+    checkpoint_path=None,
+    quarantine=None,
+):
+    """
+    Scrape one tenant. With `snapshot_path` only the properties that changed
+    since the last run are re-parsed; the merged result is returned, or with
+    `changes_only` a dict of added, changed and removed records. `processes`
+    spreads parsing over a process pool. `cache` is a ResponseCache for the
+    house and property requests. The price and status changes of the run
+    are appended to `history`, a HistoryStore. Safe to call from code that
+    runs an event loop: it blocks the caller until the run is done.
+
+    With `checkpoint_path` downloaded pages are kept in a Checkpoint until
+    the run completes: failed pages are retried on their own, a run that
+    still misses pages returns the partial result, and the next run with
+    the same path fetches only what is missing. Records that fail to parse
+    go to `quarantine` instead of failing the run.
+    """
+    checkpoint = Checkpoint(checkpoint_path) if checkpoint_path else None
+    quarantined = len(quarantine) if quarantine is not None else 0
+    pb = AsyncProfitbase(tenant.profitbase_id, tenant.host, base_url=tenant.base_url, cache=cache)
+    tenant.configure(pb.sync)
+    try:
+        comissions, estates = run_coroutine(
+            fetch_estates(pb, list(tenant.parsers), concurrency, tenant.make_page_limit, checkpoint)
+        )
+    finally:
+        pb.close()
+    failed = checkpoint.failed() if checkpoint else []
+    if failed:
+        logging.warning(
+            f"Tenant {tenant.name}: {len(failed)} pages missing, partial result; "
+            f"rerun with {checkpoint_path} to fetch them"
+        )
+        if history is not None:
+            # неполный прогон выглядел бы как снятие объектов с продажи
+            logging.warning(f"Tenant {tenant.name}: history not updated for a partial run")
+            history = None
+
+    if not snapshot_path:
+        records = parse_estates(tenant, comissions, estates, processes, quarantine=quarantine)
+    else:
+        snapshot = Snapshot(snapshot_path)
+        previous = snapshot.parse(tenant, comissions, estates, quarantine)
+        # объекты с недокачанных страниц остаются в снимке как были
+        for prop_type in {row[0] for row in failed}:
+            for key, entry in previous.items():
+                if key.startswith(f"{prop_type}/") and key not in snapshot.entries:
+                    snapshot.entries[key] = entry
+        snapshot.save()
+        records = snapshot.records()
+    if history is not None:
+        # объекты из карантина не пропали с продажи, их просто не удалось разобрать
+        keep = quarantine.ids(tenant, quarantined) if quarantine is not None else ()
+        history.record_run(tenant.name, records, types=tenant.record_types(), keep=keep)
+    if checkpoint:
+        if failed:
+            checkpoint.close()
+        else:
+            checkpoint.clear()
+    if not snapshot_path:
+        return records
+    if changes_only:
+        return snapshot.changes(previous)
+    return records
+
+
+class TenantResult(object):
+    def __init__(self, tenant, data=None, error=None, elapsed=None):
+        self.tenant = tenant
+        self.data = data
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class TenantRunner(object):
+    """
+    Scrape many tenants in one process.
+
+    Tenants are scheduled on a shared pool of `workers` threads that also
+    share one keep-alive session. Requests to the same Profitbase host go
+    through a per-host semaphore, so at most `per_host` of them run at once
+    no matter how many workers are free.
+    """
+
+    def __init__(self, workers=4, per_host=2, output_dir=None, cache=None, history=None, quarantine=None):
+        self.workers = workers
+        self.per_host = per_host
+        self.output_dir = output_dir
+        self.cache = cache
+        # HistoryStore, в который пишутся изменения каждого арендатора
+        self.history = history
+        # Quarantine для записей, которые не удалось разобрать
+        self.quarantine = quarantine
+        # Страниц одного типа, загружаемых одновременно, и процессов разбора
+        self.concurrency = None
+        self.processes = None
+        self.session = make_session(workers)
+        self._limiters = {}
+        self._limiters_lock = threading.Lock()
+
+    def limiter(self, api_host):
+        with self._limiters_lock:
+            if api_host not in self._limiters:
+                self._limiters[api_host] = threading.BoundedSemaphore(self.per_host)
+            return self._limiters[api_host]
+
+    def client(self, tenant):
+        pb = Profitbase(
+            tenant.profitbase_id, tenant.host, base_url=tenant.base_url, session=self.session, cache=self.cache
+        )
+        pb.limiter = self.limiter(pb.api_host)
+        return tenant.configure(pb)
+
+    def parsers(self, tenant, comissions):
+        return make_parsers(tenant, comissions)
+
+    def collect(self, tenant):
+        pb = self.client(tenant)
+        quarantined = len(self.quarantine) if self.quarantine is not None else 0
+        token = get_token(pb)
+        comissions = pb.get_house_comissions(token)
+        estates = {
+            prop_type: pb.get_estate(token, prop_type, tenant.make_page_limit(), self.concurrency)
+            for prop_type in tenant.parsers
+        }
+        records = parse_estates(
+            tenant,
+            comissions,
+            estates,
+            self.processes,
+            parsers=self.parsers(tenant, comissions),
+            quarantine=self.quarantine,
+        )
+        if self.history is not None:
+            keep = self.quarantine.ids(tenant, quarantined) if self.quarantine is not None else ()
+            self.history.record_run(tenant.name, records, types=tenant.record_types(), keep=keep)
+        return records
+
+    def run_one(self, tenant):
+        start = time.perf_counter()
+        try:
+            result = TenantResult(tenant, data=self.collect(tenant))
+        except Exception:
+            logging.exception(f"Tenant {tenant.name} failed")
+            result = TenantResult(tenant, error=traceback.format_exc())
+        result.elapsed = time.perf_counter() - start
+        if self.output_dir:
+            self.write(result)
+        return result
+
+    def write(self, result):
+        os.makedirs(self.output_dir, exist_ok=True)
+        if result.ok:
+            path = os.path.join(self.output_dir, f"{result.tenant.name}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(result.data, f, indent=4, cls=DecimalEncoder)
+        else:
+            path = os.path.join(self.output_dir, f"{result.tenant.name}.error.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(result.error)
+
+    def run(self, tenants):
+        """Returns {tenant name: TenantResult} in the order of `tenants`."""
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(self.run_one, tenants))
+        finally:
+            self.session.close()
+        return {result.tenant.name: result for result in results}
+
 
-    flats = pb.get_estate(token, "property")
-    parser = ApartmentParser(host, comissions)
-    data += list(map(parser.parse, flats))
-    commerce = pb.get_estate(token, "commercial_premises")
-    parser = CommercialParser(host, comissions)
-    data += list(map(parser.parse, commerce))
-    parkings = pb.get_estate(token, "pantry")
-    parser = ParkingParser(host, comissions)
-    data += list(map(parser.parse, parkings))
+def run_tenants(tenants, workers=4, per_host=2, output_dir=None, cache=None, history=None, quarantine=None):
+    return TenantRunner(workers, per_host, output_dir, cache, history, quarantine).run(tenants)
 
-    return list(filter(lambda e: has_price(e), data))
+
+"""
+Daemon
+
+"""
+
+
+class TenantState(object):
+    """Latest result of one tenant in the daemon and its refresh schedule."""
+
+    def __init__(self, tenant, interval):
+        self.tenant = tenant
+        self.records = None
+        # Сериализованные records, отдаются HTTP-клиентам как есть
+        self.body = None
+        self.etag = None
+        self.updated_at = None
+        self.error = None
+        # Текущий период опроса, сек
+        self.interval = interval
+        self.next_refresh = 0.0
+        self.refreshing = False
+        self.refreshes = 0
+        self.changes = 0
+
+    def info(self):
+        return {
+            "name": self.tenant.name,
+            "records": None if self.records is None else len(self.records),
+            "updated_at": self.updated_at,
+            "next_refresh": self.next_refresh,
+            "interval": self.interval,
+            "refreshes": self.refreshes,
+            "last_changes": self.changes,
+            "error": self.error,
+        }
+
+
+class Daemon(TenantRunner):
+    """
+    Keep refreshing tenants in one long-running process and serve their
+    latest records over HTTP.
+
+    Profitbase clients, tokens, parsers and the keep-alive session live for
+    the whole process. A tenant whose records changed on the last refresh
+    is polled twice as often (down to `min_interval`), an unchanged one 1.5
+    times less often (up to `max_interval`); a failed refresh backs off
+    the same way and keeps serving the previous result.
+
+    Endpoints: GET /tenants, GET /tenants/<name> (records as a JSON array,
+    with ETag), POST /tenants/<name>/refresh.
+    """
+
+    def __init__(
+        self,
+        tenants,
+        workers=4,
+        per_host=2,
+        cache=None,
+        history=None,
+        min_interval=60,
+        max_interval=3600,
+        quarantine=None,
+    ):
+        super().__init__(workers, per_host, cache=cache, history=history, quarantine=quarantine)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.states = {tenant.name: TenantState(tenant, min_interval) for tenant in tenants}
+        self._clients = {}
+        self._parsers = {}
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self._server = None
+
+    def client(self, tenant):
+        if tenant.name not in self._clients:
+            self._clients[tenant.name] = super().client(tenant)
+        return self._clients[tenant.name]
+
+    def parsers(self, tenant, comissions):
+        # парсеры (и их кэши фич) живут, пока не поменялись сроки сдачи
+        cached = self._parsers.get(tenant.name)
+        if cached is None or cached[0] != comissions:
+            cached = self._parsers[tenant.name] = (comissions, super().parsers(tenant, comissions))
+        return cached[1]
+
+    def refresh(self, state):
+        start = time.perf_counter()
+        try:
+            records = self.collect(state.tenant)
+        except Exception:
+            logging.exception(f"Tenant {state.tenant.name} failed")
+            with self._cond:
+                state.error = traceback.format_exc()
+                state.interval = min(self.max_interval, state.interval * 2)
+            return
+        body = default_codec().dumps(records).encode("utf-8")
+        old = set(map(repr, map(EstateObject.to_tuple, state.records or ())))
+        new = set(map(repr, map(EstateObject.to_tuple, records)))
+        changes = len(old ^ new)
+        with self._cond:
+            state.records = records
+            state.body = body
+            state.etag = '"%s"' % hashlib.sha1(body).hexdigest()
+            state.updated_at = time.time()
+            state.error = None
+            state.refreshes += 1
+            state.changes = changes
+            if changes:
+                state.interval = max(self.min_interval, state.interval / 2)
+            else:
+                state.interval = min(self.max_interval, state.interval * 1.5)
+        METRICS.observe("daemon_refresh", time.perf_counter() - start, tenant=state.tenant.name)
+
+    def _run_refresh(self, state):
+        try:
+            self.refresh(state)
+        finally:
+            with self._cond:
+                state.refreshing = False
+                state.next_refresh = time.time() + state.interval
+                self._cond.notify_all()
+
+    def request_refresh(self, name):
+        """Move a tenant to the front of the queue. False for unknown tenants."""
+        with self._cond:
+            state = self.states.get(name)
+            if state is None:
+                return False
+            state.next_refresh = 0.0
+            self._cond.notify_all()
+            return True
+
+    def run_forever(self):
+        """Refresh tenants as they fall due until stop() is called."""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while not self._stopped.is_set():
+                with self._cond:
+                    now = time.time()
+                    idle = [s for s in self.states.values() if not s.refreshing]
+                    due = sorted((s for s in idle if s.next_refresh <= now), key=lambda s: s.next_refresh)
+                    for state in due:
+                        state.refreshing = True
+                        executor.submit(self._run_refresh, state)
+                    if not due:
+                        wait = min((s.next_refresh for s in idle), default=now + self.max_interval) - now
+                        self._cond.wait(max(0.01, min(wait, 1.0)))
+        self.session.close()
+
+    def serve(self, host="127.0.0.1", port=8080, socket_path=None):
+        """Start the HTTP endpoint on a TCP port or a Unix socket in the background."""
+        import http.server
+        import socketserver
+
+        daemon = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=b"", headers=()):
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parts = urlparse(self.path).path.strip("/").split("/")
+                with daemon._cond:
+                    if parts == ["tenants"]:
+                        info = [state.info() for state in daemon.states.values()]
+                        return self._send(200, json.dumps(info, ensure_ascii=False).encode("utf-8"))
+                    state = daemon.states.get(parts[1]) if len(parts) == 2 and parts[0] == "tenants" else None
+                    if state is None:
+                        return self._send(404)
+                    body, etag = state.body, state.etag
+                if body is None:
+                    return self._send(503, headers=[("Retry-After", "5")])
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, headers=[("ETag", etag)])
+                self._send(200, body, [("ETag", etag)])
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                parts = urlparse(self.path).path.strip("/").split("/")
+                if len(parts) == 3 and parts[0] == "tenants" and parts[2] == "refresh":
+                    if daemon.request_refresh(parts[1]):
+                        return self._send(202)
+                self._send(404)
+
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+            class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+                daemon_threads = True
+
+                def get_request(self):
+                    # BaseHTTPRequestHandler ждёт адрес клиента в виде (host, port)
+                    request, _ = super().get_request()
+                    return request, ("unix", 0)
+
+            self._server = Server(socket_path, Handler)
+        else:
+            self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+            self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+    def stop(self):
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+"""
+Command line
+
+"""
+
+OUTPUT_FORMATS = ("json", "compact", "ndjson", "csv", "parquet", "arrow")
+# Расширение файла арендатора в каталоге --output
+OUTPUT_EXTENSIONS = {format: format for format in OUTPUT_FORMATS}
+OUTPUT_EXTENSIONS["compact"] = "json"
+
+
+def build_arg_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="anapolisdom_parser",
+        description="Scrape Profitbase catalogs into JSON, NDJSON, CSV or Parquet.",
+    )
+    parser.add_argument(
+        "--tenants",
+        metavar="FILE",
+        help="JSON list of tenants (default: the built-in anapolisdom tenant)",
+    )
+    parser.add_argument(
+        "--tenant",
+        action="append",
+        metavar="NAME",
+        help="only scrape this tenant, by name or profitbase id; repeatable",
+    )
+    parser.add_argument(
+        "--types", nargs="+", metavar="TYPE", choices=sorted(PARSERS), help="property types to scrape"
+    )
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="json")
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="PATH",
+        help="output file (default: stdout); with several tenants, a directory with one file per tenant",
+    )
+    parser.add_argument(
+        "--incremental",
+        metavar="DIR",
+        help="keep one snapshot per tenant in DIR and only re-parse changed properties",
+    )
+    parser.add_argument(
+        "--changes-only",
+        action="store_true",
+        help="with --incremental, write only added, changed and removed records (json or compact)",
+    )
+    parser.add_argument("--cache", metavar="PATH", help="response cache (*.sqlite file or a directory)")
+    parser.add_argument(
+        "--offline", action="store_true", help="serve everything from --cache, never touch the network"
+    )
+    parser.add_argument("--history", metavar="PATH", help="append price and status changes to this SQLite file")
+    parser.add_argument(
+        "--checkpoint",
+        metavar="DIR",
+        help="keep downloaded pages in DIR until a run completes; a rerun resumes from there",
+    )
+    parser.add_argument(
+        "--quarantine",
+        metavar="PATH",
+        help="set records that fail to parse aside in this NDJSON file instead of aborting",
+    )
+    parser.add_argument("--concurrency", type=int, help="property pages fetched at once")
+    parser.add_argument("--processes", type=int, help="parse on a pool of this many processes")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep refreshing the tenants and serve their latest records over HTTP",
+    )
+    parser.add_argument("--listen", metavar="HOST:PORT", default="127.0.0.1:8080", help="daemon HTTP address")
+    parser.add_argument("--socket", metavar="PATH", help="serve the daemon on this Unix socket instead")
+    parser.add_argument("--workers", type=int, default=4, help="tenants scraped at once")
+    parser.add_argument("--min-interval", type=float, default=60, help="daemon: shortest refresh period, s")
+    parser.add_argument("--max-interval", type=float, default=3600, help="daemon: longest refresh period, s")
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        default=os.environ.get("PROFITBASE_METRICS"),
+        help="write run metrics here (.prom for Prometheus text, JSON otherwise)",
+    )
+    return parser
+
+
+def select_tenants(args):
+    tenants = load_tenants(args.tenants) if args.tenants else [ANAPOLISDOM]
+    if args.tenant:
+        tenants = [t for t in tenants if t.name in args.tenant or t.profitbase_id in args.tenant]
+    if args.types:
+        selected = []
+        for tenant in tenants:
+            tenant = copy.copy(tenant)
+            tenant.parsers = {t: c for t, c in tenant.parsers.items() if t in args.types}
+            selected.append(tenant)
+        tenants = selected
+    return tenants
+
+
+def state_name(args, tenant):
+    """
+    File name stem of the tenant's snapshot and checkpoint. A --types run
+    keeps its own, so it never drops the other types from a full run's.
+    """
+    if not args.types:
+        return tenant.name
+    return f"{tenant.name}.{'+'.join(sorted(tenant.parsers))}"
+
+
+def snapshot_path(args, tenant):
+    os.makedirs(args.incremental, exist_ok=True)
+    return os.path.join(args.incremental, f"{state_name(args, tenant)}.snapshot.json")
+
+
+def checkpoint_path(args, tenant):
+    if not args.checkpoint:
+        return None
+    os.makedirs(args.checkpoint, exist_ok=True)
+    return os.path.join(args.checkpoint, f"{state_name(args, tenant)}.checkpoint.sqlite")
+
+
+def collect_records(tenant, args, cache, history, quarantine):
+    """The tenant's records, streamed unless the run needs the full result."""
+    if args.incremental or args.checkpoint or history is not None:
+        return get_data(
+            tenant,
+            args.concurrency,
+            snapshot_path(args, tenant) if args.incremental else None,
+            changes_only=args.changes_only,
+            processes=args.processes,
+            cache=cache,
+            history=history,
+            checkpoint_path=checkpoint_path(args, tenant),
+            quarantine=quarantine,
+        )
+    return stream_data(tenant, args.concurrency, args.processes, cache, quarantine)
+
+
+def write_records(records, format, stream=None, path=None):
+    """Write `records` in an OUTPUT_FORMATS format; parquet and arrow go to `path`."""
+    if format == "json":
+        return dump_json_stream(records, stream)
+    if format == "compact":
+        return dump_json_stream(records, stream, compact=True)
+    if format == "ndjson":
+        return dump_ndjson(records, stream, default_codec())
+    if format == "csv":
+        return CsvExporter(stream).export(records)
+    return export_records(records, path, format)
+
+
+class CliRunner(TenantRunner):
+    """
+    TenantRunner for a command-line run over several tenants: each tenant
+    is scraped with the run's options and written to its own file in the
+    --output directory, so one failing tenant does not abort the others.
+    """
+
+    def __init__(self, args, cache=None, history=None, quarantine=None):
+        super().__init__(
+            args.workers, output_dir=args.output, cache=cache, history=history, quarantine=quarantine
+        )
+        self.args = args
+        self.concurrency = args.concurrency
+        self.processes = args.processes
+
+    def collect(self, tenant):
+        if self.args.incremental or self.args.checkpoint:
+            return collect_records(tenant, self.args, self.cache, self.history, self.quarantine)
+        return super().collect(tenant)
+
+    def write(self, result):
+        if not result.ok:
+            return super().write(result)
+        os.makedirs(self.output_dir, exist_ok=True)
+        format = self.args.format
+        path = os.path.join(self.output_dir, f"{result.tenant.name}.{OUTPUT_EXTENSIONS[format]}")
+        if format in ("parquet", "arrow"):
+            return write_records(result.data, format, path=path)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            if self.args.changes_only:
+                dumpResult(result.data, f, compact=format == "compact")
+            else:
+                write_records(result.data, format, f)
+
+
+def run_daemon(tenants, args, cache, history, quarantine):
+    daemon = Daemon(
+        tenants,
+        workers=args.workers,
+        cache=cache,
+        history=history,
+        min_interval=args.min_interval,
+        max_interval=args.max_interval,
+        quarantine=quarantine,
+    )
+    host, _, port = args.listen.rpartition(":")
+    daemon.serve(host or "127.0.0.1", int(port), args.socket)
+    logging.info(f"Serving {len(tenants)} tenants on {args.socket or args.listen}")
+    try:
+        daemon.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop()
+        if history is not None:
+            history.close()
+        if args.metrics:
+            METRICS.write(args.metrics)
+    return 0
+
+
+def run_cli_tenants(tenants, args, cache, history, quarantine):
+    """Scrape several tenants through a CliRunner; exit status 1 if any of them failed."""
+    try:
+        results = CliRunner(args, cache, history, quarantine).run(tenants)
+    finally:
+        if history is not None:
+            history.close()
+    if args.metrics:
+        METRICS.write(args.metrics)
+    failed = [name for name, result in results.items() if not result.ok]
+    if failed:
+        logging.error(f"Failed tenants: {', '.join(failed)}")
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.offline and not args.cache:
+        parser.error("--offline needs --cache")
+    if args.changes_only and not args.incremental:
+        parser.error("--changes-only needs --incremental")
+    if args.changes_only and args.format not in ("json", "compact"):
+        parser.error("--changes-only writes a JSON document; use --format json or compact")
+    if args.format in ("parquet", "arrow"):
+        if not args.output:
+            parser.error(f"--format {args.format} needs --output")
+        if importlib.util.find_spec("pyarrow") is None:
+            parser.error(f"--format {args.format} needs pyarrow; use --format csv without it")
+
+    tenants = select_tenants(args)
+    if not tenants:
+        parser.error("no tenant matches --tenant")
+    if len(tenants) > 1 and not args.daemon and not args.output:
+        parser.error("several tenants are written one file each; give --output DIR")
+    if args.metrics:
+        enable_metrics()
+    cache = ResponseCache.open(args.cache, offline=args.offline) if args.cache else None
+    history = HistoryStore(args.history) if args.history else None
+    quarantine = Quarantine(args.quarantine) if args.quarantine else None
+    if args.daemon:
+        return run_daemon(tenants, args, cache, history, quarantine)
+    if len(tenants) > 1:
+        return run_cli_tenants(tenants, args, cache, history, quarantine)
+
+    # parquet и arrow pyarrow пишет в файл сам
+    to_file = args.output and args.format not in ("parquet", "arrow")
+    stream = open(args.output, "w", encoding="utf-8", newline="") if to_file else sys.stdout
+    try:
+        result = collect_records(tenants[0], args, cache, history, quarantine)
+        if args.changes_only:
+            dumpResult(result, stream, compact=args.format == "compact")
+        else:
+            write_records(result, args.format, stream, args.output)
+    finally:
+        if to_file:
+            stream.close()
+        if history is not None:
+            history.close()
+    if args.metrics:
+        METRICS.write(args.metrics)
+    return 0
 
 
 if __name__ == "__main__":
-    dumpResult(get_data())
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Memory and serialization throughput of slotted EstateObject records against
+the per-instance dicts the parsers used to return.
+
+    python benchmarks/bench_estate_object.py --records 100000
+
+"""
+
+import argparse
+import gc
+import io
+import json
+import time
+import tracemalloc
+
+from mock_server import HOUSES, make_property
+
+from anapolisdom_parser import (
+    ApartmentParser,
+    CommercialParser,
+    DecimalEncoder,
+    EstateObject,
+    ParkingParser,
+    records_to_columns,
+    records_to_tuples,
+)
+
+
+def build(count):
+    comissions = {house["id"]: "IV кв 2025" for house in HOUSES}
+    parsers = [
+        ApartmentParser("https://example.invalid/", comissions),
+        CommercialParser("https://example.invalid/", comissions),
+        ParkingParser("https://example.invalid/", comissions),
+    ]
+    return [parsers[i % 3].parse(make_property(i)) for i in range(count)]
+
+
+def measure_memory(factory):
+    gc.collect()
+    tracemalloc.start()
+    records = factory()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return records, size
+
+
+def timed(label, count, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {elapsed:7.3f} s  {count / elapsed:10.0f} records/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=100_000)
+    args = parser.parse_args()
+    count = args.records
+
+    objects = build(count)
+    # Both containers share the same field values, so only the per-record
+    # overhead is measured.
+    dicts, dict_size = measure_memory(lambda: [o.to_dict() for o in objects])
+    _, slotted_size = measure_memory(lambda: [EstateObject.from_dict(d) for d in dicts])
+    print(f"{count} records")
+    print(f"{'dict records':<34} {dict_size / 2 ** 20:7.1f} MiB")
+    print(f"{'slotted EstateObject':<34} {slotted_size / 2 ** 20:7.1f} MiB")
+
+    def legacy_dump(indent):
+        stream = io.StringIO()
+        for record in dicts:
+            stream.write(json.dumps(record, indent=indent, cls=DecimalEncoder))
+            stream.write("\n")
+
+    def fast_dump(indent):
+        stream = io.StringIO()
+        for record in objects:
+            stream.write(record.to_json(indent=bool(indent)))
+            stream.write("\n")
+
+    for indent in (None, 4):
+        label = "indent=4" if indent else "compact"
+        legacy = timed(f"json.dumps dict, {label}", count, lambda: legacy_dump(indent))
+        fast = timed(f"EstateObject.to_json, {label}", count, lambda: fast_dump(indent))
+        print(f"{'serializer speed-up':<34} x{legacy / fast:6.2f}")
+    timed("records_to_tuples", count, lambda: records_to_tuples(objects))
+    timed("records_to_columns", count, lambda: records_to_columns(objects))
+
+
+if __name__ == "__main__":
+    main()
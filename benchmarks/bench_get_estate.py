@@ -0,0 +1,48 @@
+"""
+Sequential vs concurrent pagination in Profitbase.get_estate.
+
+    python benchmarks/bench_get_estate.py --total 3000 --latency 0.05
+
+"""
+
+import argparse
+import time
+
+from mock_server import MockProfitbase
+
+from anapolisdom_parser import Profitbase
+
+
+def run(pb, concurrency, page_limit):
+    start = time.perf_counter()
+    result = pb.get_estate("mock-token", "property", page_limit=page_limit, concurrency=concurrency)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--total", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--page-limit", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    with MockProfitbase(total=args.total, latency=args.latency) as mock:
+        pb = Profitbase("pb0", "https://example.invalid/", base_url=mock.base_url)
+        pages = -(-args.total // args.page_limit)
+        print(f"{args.total} objects, {pages} pages, {args.latency * 1000:.0f} ms per request")
+        baseline_time, baseline = run(pb, None, args.page_limit)
+        print(f"{'sequential':>14}: {baseline_time:7.3f} s")
+        for concurrency in args.concurrency:
+            if concurrency <= 1:
+                continue
+            elapsed, result = run(pb, concurrency, args.page_limit)
+            same = [e["id"] for e in result] == [e["id"] for e in baseline]
+            print(
+                f"{'concurrency=' + str(concurrency):>14}: {elapsed:7.3f} s"
+                f"  x{baseline_time / elapsed:5.1f}  same order: {same}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Decode and encode throughput of the JSON codecs that are installed.
+
+    python benchmarks/harness.py record fixtures/synthetic --mock 5000
+    python benchmarks/bench_json_codec.py fixtures/synthetic --repeat 5
+
+Decoding runs over the recorded /property pages as the server sent them,
+encoding over the records parsed from those pages. Without a fixture
+directory the pages are generated from the mock tenant.
+
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import time
+
+from harness import load_tenant
+from mock_server import HOUSES, make_property
+
+from anapolisdom_parser import (
+    CODECS,
+    PARSERS,
+    Profitbase,
+    Tenant,
+    dump_json_stream,
+    dump_ndjson,
+    parse_estates,
+)
+
+
+def load_pages(directory):
+    """Raw bodies of the recorded property pages and the house comissions."""
+    config = load_tenant(directory)
+    pb = Profitbase(config["profitbase_id"], config["host"])
+    pages = []
+    comissions = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        if os.path.basename(path) == "tenant.json":
+            continue
+        with open(path, encoding="utf-8") as f:
+            fixture = json.load(f)
+        if fixture["key"].startswith("GET property?"):
+            pages.append(json.dumps(fixture["body"]).encode("utf-8"))
+        elif fixture["key"].startswith("GET house?"):
+            comissions.update(pb.house_comissions(fixture["body"]["data"]))
+    return pages, comissions
+
+
+def mock_pages(total, page_limit=100):
+    pages = []
+    for prop_type in PARSERS:
+        for offset in range(0, total, page_limit):
+            properties = [make_property(i, prop_type) for i in range(offset, min(offset + page_limit, total))]
+            body = {"data": {"filteredCount": total, "properties": properties}}
+            pages.append(json.dumps(body).encode("utf-8"))
+    comissions = {house["id"]: "IV кв 2025" for house in HOUSES}
+    return pages, comissions
+
+
+def best_of(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("fixtures", nargs="?")
+    parser.add_argument("--mock", type=int, default=5000, help="records per type without fixtures")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.fixtures:
+        pages, comissions = load_pages(args.fixtures)
+        config = load_tenant(args.fixtures)
+        tenant = Tenant(config["profitbase_id"], config["host"], config["region"])
+    else:
+        pages, comissions = mock_pages(args.mock)
+        tenant = Tenant("pbmock", "https://example.invalid/", "Анапа")
+
+    codecs = []
+    for name, codec_class in CODECS.items():
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            print(f"{name}: not installed")
+
+    size = sum(map(len, pages))
+    estates = {}
+    for page in pages:
+        for item in json.loads(page)["data"]["properties"]:
+            estates.setdefault(item.get("propertyType", "property"), []).append(item)
+    estates = {prop_type: estates.get(prop_type, []) for prop_type in tenant.parsers}
+    records = parse_estates(tenant, comissions, estates)
+    print(f"{len(pages)} pages, {size / 2 ** 20:.1f} MiB, {len(records)} records")
+
+    print(f"{'decode':<28} {'time, s':>9} {'MiB/s':>9}")
+    for codec in codecs:
+        elapsed = best_of(lambda: [codec.loads(page) for page in pages], args.repeat)
+        print(f"{codec.name:<28} {elapsed:>9.3f} {size / 2 ** 20 / elapsed:>9.1f}")
+
+    print(f"{'encode':<28} {'time, s':>9} {'records/s':>11} {'MiB':>7}")
+
+    def report(label, write):
+        stream = io.StringIO()
+        write(stream)
+        output = len(stream.getvalue().encode("utf-8"))
+        elapsed = best_of(lambda: write(io.StringIO()), args.repeat)
+        print(f"{label:<28} {elapsed:>9.3f} {len(records) / elapsed:>11.0f} {output / 2 ** 20:>7.1f}")
+
+    report("json indent=4 (DecimalEncoder)", lambda stream: dump_json_stream(records, stream))
+    report("json ndjson (to_json)", lambda stream: dump_ndjson(records, stream))
+    for codec in codecs:
+        report(f"{codec.name} compact array", lambda stream: dump_json_stream(records, stream, True, codec))
+        report(f"{codec.name} ndjson", lambda stream: dump_ndjson(records, stream, codec))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Parsing throughput of ParsePool against in-process parsing as the number of
+worker processes grows.
+
+    python benchmarks/bench_parse_pool.py --records 60000 --workers 1 2 4 8
+
+"""
+
+import argparse
+import os
+import time
+
+from mock_server import HOUSES, make_property
+
+from anapolisdom_parser import PARSERS, ParsePool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=60_000)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    comissions = {house["id"]: "IV кв 2025" for house in HOUSES}
+    parsers = {
+        prop_type: parser_class("https://example.invalid/", comissions)
+        for prop_type, parser_class in PARSERS.items()
+    }
+    records = [make_property(i) for i in range(args.records)]
+    print(f"{args.records} records per property type, {os.cpu_count()} CPUs")
+
+    start = time.perf_counter()
+    expected = {
+        prop_type: [p.to_tuple() for p in map(parser.parse, records)]
+        for prop_type, parser in parsers.items()
+    }
+    baseline = time.perf_counter() - start
+    total = args.records * len(parsers)
+    print(f"{'in-process':>12}: {baseline:7.3f} s  {total / baseline:9.0f} records/s")
+
+    for workers in args.workers:
+        start = time.perf_counter()
+        shared = dict.fromkeys(parsers, records)
+        with ParsePool(parsers, workers, args.chunk_size, records=shared) as pool:
+            parsed = {
+                prop_type: [p.to_tuple() for p in pool.iter_parse(prop_type, records)]
+                for prop_type in parsers
+            }
+        elapsed = time.perf_counter() - start
+        print(
+            f"{'workers=' + str(workers):>12}: {elapsed:7.3f} s  {total / elapsed:9.0f} records/s"
+            f"  x{baseline / elapsed:5.2f}  same order: {parsed == expected}"
+        )
+
+
+if __name__ == "__main__":
+    main()
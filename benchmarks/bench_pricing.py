@@ -0,0 +1,125 @@
+"""
+Page-level pricing (BaseParser.price_rows) against the per-record helpers
+the parsers used before: get_prices, get_discount and get_discount_percent
+called once per item.
+
+    python benchmarks/bench_pricing.py --records 50000 --page 100
+
+Before timing, both are run on randomized prices and offers (missing and
+zero prices, sale equal to price, percent and currency units, string
+values) and must give the same Decimals and floats.
+
+"""
+
+import argparse
+import random
+import timeit
+from decimal import Decimal
+
+from mock_server import HOUSES, make_property
+
+from anapolisdom_parser import PARSERS
+
+
+def dec_or_none(value):
+    return Decimal(value) if value else None
+
+
+def get_prices(data):
+    price = dec_or_none(data["price"]["value"])
+    price_sale = None
+    if len(data["specialOffers"]):
+        discount = data["specialOffers"][0]["discount"]
+        price_sale = discount["calculate"]["price"]
+        price_sale = Decimal(int(price_sale)) if price_sale else None
+        if price_sale == price:
+            price_sale = None
+    return price, price_sale
+
+
+def get_discount(price, sale_price):
+    if price and sale_price:
+        return price - sale_price
+    return None
+
+
+def get_discount_percent(data):
+    discount_percent = None
+    if len(data["specialOffers"]):
+        discount = data["specialOffers"][0]["discount"]
+        units = discount["unit"]
+        if discount["value"] and units.lower() == "percent":
+            discount_percent = float(discount["value"])
+    return discount_percent
+
+
+def legacy_prices(data):
+    price, price_sale = get_prices(data)
+    return price, price_sale, get_discount(price, price_sale), get_discount_percent(data)
+
+
+def random_item(rnd):
+    price = rnd.choice([None, 0, "0", rnd.randint(1, 10 ** 8), str(rnd.randint(1, 10 ** 8))])
+    offers = []
+    for _ in range(rnd.choice([0, 1, 2])):
+        sale = rnd.choice([None, 0, price, rnd.uniform(1, 10 ** 8), str(rnd.randint(1, 10 ** 8))])
+        offers.append(
+            {
+                "discount": {
+                    "unit": rnd.choice(["percent", "PERCENT", "currency"]),
+                    "value": rnd.choice([None, 0, 5, "7.5", 12.25]),
+                    "calculate": {"price": sale},
+                }
+            }
+        )
+    return {"price": {"value": price}, "specialOffers": offers}
+
+
+def check(estate_parser, count=20_000):
+    rnd = random.Random(18)
+    items = [random_item(rnd) for _ in range(count)]
+    assert estate_parser.price_rows(items) == [legacy_prices(data) for data in items]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--records", type=int, default=50_000)
+    parser.add_argument("--page", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    comissions = {house["id"]: "IV кв 2025" for house in HOUSES}
+    for prop_type, parser_class in PARSERS.items():
+        estate_parser = parser_class("https://example.invalid/", comissions)
+        check(estate_parser)
+        items = [make_property(i, prop_type) for i in range(args.records)]
+        pages = [items[i:i + args.page] for i in range(0, len(items), args.page)]
+
+        def legacy_pricing():
+            return [legacy_prices(data) for data in items]
+
+        def page_pricing():
+            return [row for page in pages for row in estate_parser.price_rows(page)]
+
+        def per_record():
+            return [estate_parser.parse(data) for data in items]
+
+        def per_page():
+            return [record for page in pages for record in estate_parser.parse_page(page)]
+
+        assert legacy_pricing() == page_pricing()
+        assert [r.to_tuple() for r in per_record()] == [r.to_tuple() for r in per_page()]
+        for label, single, batch in (
+            ("pricing", legacy_pricing, page_pricing),
+            ("parse", per_record, per_page),
+        ):
+            single = min(timeit.repeat(single, number=1, repeat=args.repeat))
+            batch = min(timeit.repeat(batch, number=1, repeat=args.repeat))
+            print(
+                f"{prop_type:<20} {label:<8} per record {args.records / single:9.0f} records/s"
+                f"  per page {args.records / batch:9.0f} records/s  x{single / batch:5.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
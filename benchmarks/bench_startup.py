@@ -0,0 +1,100 @@
+"""
+Startup cost of the parser: import time of the module and wall time of
+short CLI invocations, each in a fresh interpreter.
+
+    python benchmarks/bench_startup.py --runs 10 --budget-ms 60
+
+The import is measured with `python -X importtime`; the slowest imports
+pulled in by the module are listed, and the modules that are meant to load
+lazily are checked to stay out of a bare import. With --budget-ms the
+script exits with status 1 when the median import time exceeds the budget.
+
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE = "anapolisdom_parser"
+# Не должны загружаться при простом импорте модуля
+LAZY_MODULES = ("requests", "asyncio", "multiprocessing", "orjson", "ujson", "pyarrow")
+
+
+def python(*args):
+    return subprocess.run(
+        [sys.executable, *args], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+
+
+def import_profile():
+    """{module: (self us, cumulative us)} for one `import` of MODULE."""
+    stderr = python("-X", "importtime", "-c", f"import {MODULE}").stderr
+    profile = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        if own.strip().isdigit():
+            profile[name.strip()] = (int(own), int(cumulative))
+    return profile
+
+
+def loaded_lazy_modules():
+    """LAZY_MODULES whose code actually ran during a bare import."""
+    code = (
+        f"import sys, {MODULE}\n"
+        f"for name in {LAZY_MODULES!r}:\n"
+        "    module = sys.modules.get(name)\n"
+        "    if module is not None and type(module).__name__ != '_LazyModule':\n"
+        "        print(name)\n"
+    )
+    return python("-c", code).stdout.split()
+
+
+def wall_time(args, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        python(*args)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, help="fail when the median import takes longer")
+    args = parser.parse_args()
+
+    # без актуального .pyc каждый запуск заново компилирует модуль
+    python("-m", "compileall", "-q", f"{MODULE}.py")
+    profiles = [import_profile() for _ in range(args.runs)]
+    totals = [profile[MODULE][1] / 1000 for profile in profiles]
+    median = statistics.median(totals)
+    print(f"import {MODULE}: median {median:.1f} ms, min {min(totals):.1f} ms over {args.runs} runs")
+
+    slowest = sorted(profiles[-1].items(), key=lambda item: item[1][1], reverse=True)
+    print(f"{'module':<40} {'self, ms':>9} {'cumulative, ms':>15}")
+    for name, (own, cumulative) in slowest[1:args.top + 1]:
+        print(f"{name:<40} {own / 1000:>9.1f} {cumulative / 1000:>15.1f}")
+
+    eager = loaded_lazy_modules()
+    print(f"lazy modules executed on import: {', '.join(eager) if eager else 'none'}")
+
+    print(f"{'python -c pass':<40} {wall_time(['-c', 'pass'], args.runs) * 1000:>9.1f} ms")
+    # Скрипт компилируется при каждом запуске, модуль через -m берётся из .pyc
+    print(f"{MODULE + '.py --help':<40} {wall_time([MODULE + '.py', '--help'], args.runs) * 1000:>9.1f} ms")
+    print(f"{'-m ' + MODULE + ' --help':<40} {wall_time(['-m', MODULE, '--help'], args.runs) * 1000:>9.1f} ms")
+
+    if args.budget_ms and median > args.budget_ms:
+        print(f"import time {median:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
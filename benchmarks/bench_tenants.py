@@ -0,0 +1,52 @@
+"""
+Multi-tenant throughput of TenantRunner as the worker pool grows.
+
+    python benchmarks/bench_tenants.py --tenants 16 --total 300 --latency 0.02
+
+"""
+
+import argparse
+import time
+
+from mock_server import MockProfitbase
+
+from anapolisdom_parser import Tenant, TenantRunner, TokenManager
+
+
+class BenchRunner(TenantRunner):
+    def client(self, tenant):
+        pb = super().client(tenant)
+        # Не пишем токены мока в общий кэш токенов
+        pb.tokens = TokenManager(pb.profitbase_id, cache_dir=None)
+        return pb
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tenants", type=int, default=16)
+    parser.add_argument("--total", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--per-host", type=int, default=2)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    with MockProfitbase(total=args.total, latency=args.latency) as mock:
+        tenants = [
+            Tenant(f"pb{i}", "https://example.invalid/", "Анапа", base_url=mock.base_url)
+            for i in range(args.tenants)
+        ]
+        print(f"{args.tenants} tenants x 3 property types x {args.total} objects")
+        for workers in args.workers:
+            start = time.perf_counter()
+            results = BenchRunner(workers, args.per_host).run(tenants)
+            elapsed = time.perf_counter() - start
+            records = sum(len(r.data) for r in results.values() if r.ok)
+            failed = sum(not r.ok for r in results.values())
+            print(
+                f"workers={workers:<3} {elapsed:7.3f} s  {records / elapsed:9.0f} records/s"
+                f"  failed: {failed}"
+            )
+
+
+if __name__ == "__main__":
+    main()
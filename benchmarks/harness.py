@@ -0,0 +1,150 @@
+"""
+Record Profitbase responses into fixtures and replay them from a local stub.
+
+Record a real tenant (needs network access):
+
+    python benchmarks/harness.py record fixtures/anapolisdom \\
+        --profitbase-id pb13246 --host https://anapolisdom.ru/ --region Анапа
+
+Record a synthetic tenant from the mock server instead:
+
+    python benchmarks/harness.py record fixtures/synthetic --mock 5000
+
+Serve recorded fixtures on a local port:
+
+    python benchmarks/harness.py serve fixtures/anapolisdom
+
+A fixture directory holds one JSON file per response plus tenant.json with
+the tenant the responses belong to. Query params are part of the key, the
+access token is not, and recorded tokens are replaced with a placeholder.
+
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import requests
+from mock_server import MockProfitbase, StubServer
+
+from anapolisdom_parser import PARSERS, Profitbase
+
+FIXTURE_TOKEN = "fixture-token"
+
+
+def fixture_key(method, path, query):
+    """`query` as returned by parse_qs."""
+    endpoint = path.rstrip("/").rsplit("/", 1)[-1]
+    params = sorted(
+        (name, value)
+        for name, values in query.items()
+        if name != "access_token"
+        for value in values
+    )
+    return f"{method.upper()} {endpoint}?{urlencode(params)}"
+
+
+def fixture_path(directory, key):
+    return os.path.join(directory, hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + ".json")
+
+
+class RecordingSession(requests.Session):
+    """requests.Session that writes every response it receives as a fixture."""
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        self.recorded = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def request(self, method, url, *args, **kwargs):
+        res = super().request(method, url, *args, **kwargs)
+        url = urlparse(res.url)
+        key = fixture_key(method, url.path, parse_qs(url.query))
+        body = res.json()
+        if isinstance(body, dict) and "access_token" in body:
+            body = dict(body, access_token=FIXTURE_TOKEN)
+        with open(fixture_path(self.directory, key), "w", encoding="utf-8") as f:
+            json.dump({"key": key, "status": res.status_code, "body": body}, f, ensure_ascii=False)
+        self.recorded += 1
+        return res
+
+
+def record(directory, profitbase_id, host, region, base_url=None, prop_types=None):
+    """Download one tenant through a RecordingSession."""
+    session = RecordingSession(directory)
+    pb = Profitbase(profitbase_id, host, base_url=base_url, session=session)
+    token = pb.update_token()
+    pb.get_house_comissions(token)
+    for prop_type in prop_types or PARSERS:
+        pb.get_estate(token, prop_type)
+    with open(os.path.join(directory, "tenant.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            {"profitbase_id": profitbase_id, "host": host, "region": region},
+            f,
+            ensure_ascii=False,
+        )
+    return session.recorded
+
+
+def load_tenant(directory):
+    with open(os.path.join(directory, "tenant.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class FixtureServer(StubServer):
+    """Serves a fixture directory; unknown requests get 404."""
+
+    def __init__(self, directory, latency=0.0):
+        super().__init__(latency)
+        self.fixtures = {}
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            if os.path.basename(path) == "tenant.json":
+                continue
+            with open(path, encoding="utf-8") as f:
+                fixture = json.load(f)
+            self.fixtures[fixture["key"]] = json.dumps(fixture["body"]).encode("utf-8")
+
+    def body(self, method, path, query, headers):
+        return self.fixtures.get(fixture_key(method, path, query))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rec = commands.add_parser("record", help="record a tenant into a fixture directory")
+    rec.add_argument("directory")
+    rec.add_argument("--profitbase-id", default="pb13246")
+    rec.add_argument("--host", default="https://anapolisdom.ru/")
+    rec.add_argument("--region", default="Анапа")
+    rec.add_argument("--mock", type=int, metavar="TOTAL", help="record the synthetic mock tenant")
+
+    serve = commands.add_parser("serve", help="serve a fixture directory")
+    serve.add_argument("directory")
+    serve.add_argument("--latency", type=float, default=0.0)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        if args.mock:
+            with MockProfitbase(total=args.mock) as mock:
+                count = record(args.directory, "pbmock", "https://example.invalid/", "Анапа", mock.base_url)
+        else:
+            count = record(args.directory, args.profitbase_id, args.host, args.region)
+        print(f"{count} responses recorded into {args.directory}")
+    else:
+        with FixtureServer(args.directory, args.latency) as server:
+            print(f"{len(server.fixtures)} fixtures on {server.base_url}")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
+
+
+if __name__ == "__main__":
+    main()
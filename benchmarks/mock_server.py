@@ -0,0 +1,241 @@
+"""
+Local stand-in for the Profitbase API used by the benchmarks.
+
+Serves /authentication, /house and paginated /property responses built from
+synthetic records, with an optional per-request latency to emulate the real
+round-trip to profitbase.ru.
+
+"""
+
+import hashlib
+import json
+from collections import Counter
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+HOUSES = [
+    {
+        "id": 100 + i,
+        "buildingState": "UNFINISHED" if i % 3 else "HAND-OVER",
+        "developmentEndQuarter": {"quarter": i % 4 + 1, "year": 2025 + i % 3},
+    }
+    for i in range(6)
+]
+
+FEATURE_FIELDS = [
+    "Кухня-гостиная",
+    "Теплая лоджия",
+    "Гардеробная",
+    "Окна на две стороны",
+    "Мастер-спальня",
+    "Второй санузел",
+]
+
+
+# Profitbase property ids are unique across property types
+ID_OFFSETS = {"property": 1_000_000, "commercial_premises": 2_000_000, "pantry": 3_000_000}
+
+
+def make_property(i, prop_type="property"):
+    """Synthetic record shaped like a `full=true` /property item."""
+    house = HOUSES[i % len(HOUSES)]
+    price = 3_500_000 + (i * 7919) % 9_000_000
+    offers = []
+    if i % 4 == 0:
+        offers.append(
+            {
+                "name": "Скидка",
+                "discount": {
+                    "unit": "percent",
+                    "value": 5,
+                    "calculate": {"price": price * 0.95},
+                },
+            }
+        )
+    custom_fields = [
+        {"id": "window", "name": "Вид из окна", "value": "На море" if i % 2 else None},
+        {"id": "facing", "name": "Отделка", "value": "Чистовая" if i % 3 else "Без отделки"},
+        {"id": "code", "name": "Артикул", "value": f"A-{i}"},
+        {"id": f"cf{i % 5}", "name": "Балкон", "value": "Есть" if i % 5 == 0 else "Нет"},
+    ]
+    for n, name in enumerate(FEATURE_FIELDS):
+        custom_fields.append(
+            {"id": f"feat{n}", "name": name, "value": "Есть" if (i + n) % 4 == 0 else "Нет"}
+        )
+    return {
+        "id": ID_OFFSETS.get(prop_type, 1_000_000) + i,
+        "house_id": house["id"],
+        "projectName": "ЖК Бенчмарк",
+        "houseName": f"{1 + i % 3} очередь, Дом №{house['id']}",
+        "section": f"Секция {1 + i % 4}",
+        "sectionName": f"Секция {1 + i % 4}",
+        "floor": 1 + i % 16,
+        "number": f" {i} ",
+        "rooms_amount": 1 + i % 4,
+        "studio": i % 11 == 0,
+        "status": "AVAILABLE",
+        "area": {"area_total": f"{30 + i % 70}.{i % 10}", "area_living": f"{18 + i % 40}.5"},
+        "price": {"value": price},
+        "planImages": [{"source": f"https://example.invalid/plan/{i}.png"}],
+        "specialOffers": offers,
+        "custom_fields": custom_fields,
+        "propertyType": prop_type,
+    }
+
+
+class StubServer(object):
+    """
+    Threaded local HTTP server answering Profitbase-style requests.
+
+    Subclasses implement `body(method, path, query, headers)` and return the
+    response bytes, or None for 404.
+    """
+
+    def __init__(self, latency=0.0, throttle_every=0):
+        self.latency = latency
+        # Каждый N-й запрос получает 429, как при превышении лимита API
+        self.throttle_every = throttle_every
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def authorized(self, query):
+        return True
+
+    def body(self, method, path, query, headers):
+        raise NotImplementedError
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _respond(self):
+                # The client sends a fixed "Content-Length: 123" header even on
+                # GET, so only POST bodies are drained.
+                if self.command == "POST":
+                    self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                with stub._lock:
+                    stub.requests += 1
+                    throttled = stub.throttle_every and stub.requests % stub.throttle_every == 0
+                if throttled:
+                    self.send_response(429)
+                    self.send_header("Retry-After", "0.05")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if stub.latency:
+                    time.sleep(stub.latency)
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if not stub.authorized(query):
+                    self.send_error(401)
+                    return
+                body = stub.body(self.command, url.path, query, self.headers)
+                if body is None:
+                    self.send_error(404)
+                    return
+                etag = '"%s"' % hashlib.sha1(body).hexdigest()
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _respond
+            do_POST = _respond
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class MockProfitbase(StubServer):
+    """
+    Synthetic catalog with `total` objects of every property type, served
+    to any number of tenants. Tokens are issued per tenant (the Host header
+    of the login), so one tenant logging in never revokes another's token.
+    """
+
+    def __init__(self, total=1000, latency=0.0, throttle_every=0):
+        super().__init__(latency, throttle_every)
+        self.total = total
+        # Host -> number of logins
+        self.logins = Counter()
+
+    def token(self, tenant):
+        return f"mock-token-{id(self):x}-{tenant}-{self.logins[tenant]}"
+
+    def revoke(self, tenant=None):
+        """Invalidate the token of `tenant` (default: every tenant); requests with it get 401."""
+        with self._lock:
+            for name in [tenant] if tenant else list(self.logins):
+                self.logins[name] += 1
+
+    def authorized(self, query):
+        token = query.get("access_token", [None])[0]
+        if token is None or token == "mock-token":
+            return True
+        with self._lock:
+            return token in {self.token(tenant) for tenant in self.logins}
+
+    def payload(self, path, query, tenant=None):
+        endpoint = path.rstrip("/").rsplit("/", 1)[-1]
+        if endpoint == "authentication":
+            with self._lock:
+                self.logins[tenant] += 1
+                return {"access_token": self.token(tenant), "remaining_time": 86400}
+        if endpoint == "house":
+            return {"data": HOUSES}
+        if endpoint == "property":
+            offset = int(query.get("offset", ["0"])[0])
+            limit = int(query.get("limit", ["100"])[0])
+            prop_type = query.get("propertyTypeAliases[0]", ["property"])[0]
+            properties = [
+                make_property(i, prop_type)
+                for i in range(offset, min(offset + limit, self.total))
+            ]
+            return {"data": {"filteredCount": self.total, "properties": properties}}
+        return None
+
+    def body(self, method, path, query, headers):
+        payload = self.payload(path, query, headers.get("Host"))
+        if payload is not None:
+            return json.dumps(payload).encode("utf-8")
@@ -0,0 +1,118 @@
+"""
+End-to-end benchmark of the pipeline against recorded fixtures.
+
+    python benchmarks/harness.py record fixtures/synthetic --mock 5000
+    python benchmarks/suite.py fixtures/synthetic --repeat 3 --json bench.json
+
+Every stage (fetch, parse, serialize, export) is timed on its own: the best of
+`--repeat` runs gives wall time and records per second, and one more run
+under tracemalloc gives the peak Python memory of the stage.
+
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from harness import FixtureServer, load_tenant
+
+from anapolisdom_parser import (
+    CsvExporter,
+    Profitbase,
+    Tenant,
+    TokenManager,
+    dump_json_stream,
+    dump_ndjson,
+    export_records,
+    make_session,
+    parse_estates,
+)
+
+
+def fetch(tenant, base_url):
+    pb = Profitbase(tenant.profitbase_id, tenant.host, base_url=base_url, session=make_session())
+    # Не пишем токен стаба в общий кэш токенов
+    pb.tokens = TokenManager(pb.profitbase_id, cache_dir=None)
+    token = pb.tokens.get(pb)
+    comissions = pb.get_house_comissions(token)
+    estates = {prop_type: pb.get_estate(token, prop_type) for prop_type in tenant.parsers}
+    pb.session.close()
+    return comissions, estates
+
+
+def measure(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("fixtures")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="stub latency per request, s")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    config = load_tenant(args.fixtures)
+    tenant = Tenant(config["profitbase_id"], config["host"], config["region"])
+    report = {"fixtures": os.path.abspath(args.fixtures), "stages": {}}
+
+    with FixtureServer(args.fixtures, args.latency) as server:
+        (comissions, estates), elapsed, peak = measure(
+            lambda: fetch(tenant, server.base_url), args.repeat
+        )
+    raw_count = sum(map(len, estates.values()))
+    report["stages"]["fetch"] = (raw_count, elapsed, peak)
+
+    records, elapsed, peak = measure(
+        lambda: parse_estates(tenant, comissions, estates), args.repeat
+    )
+    report["stages"]["parse"] = (raw_count, elapsed, peak)
+
+    with open(os.devnull, "w") as devnull:
+        _, elapsed, peak = measure(lambda: dump_json_stream(records, devnull), args.repeat)
+        report["stages"]["serialize_json"] = (len(records), elapsed, peak)
+        _, elapsed, peak = measure(lambda: dump_ndjson(records, devnull), args.repeat)
+        report["stages"]["serialize_ndjson"] = (len(records), elapsed, peak)
+        _, elapsed, peak = measure(lambda: CsvExporter(devnull).export(records), args.repeat)
+        report["stages"]["export_csv"] = (len(records), elapsed, peak)
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "records.parquet")
+            _, elapsed, peak = measure(lambda: export_records(records, path), args.repeat)
+            report["stages"]["export_parquet"] = (len(records), elapsed, peak)
+
+    print(f"{'stage':<18} {'records':>8} {'time, s':>9} {'records/s':>11} {'peak, MiB':>10}")
+    for stage, (count, elapsed, peak) in report["stages"].items():
+        print(
+            f"{stage:<18} {count:>8} {elapsed:>9.3f} {count / elapsed:>11.0f} {peak / 2 ** 20:>10.1f}"
+        )
+        report["stages"][stage] = {
+            "records": count,
+            "seconds": elapsed,
+            "records_per_second": count / elapsed,
+            "peak_bytes": peak,
+        }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+# Токены мок-сервера не должны попадать в общий кэш токенов
+os.environ["PROFITBASE_CACHE_DIR"] = tempfile.mkdtemp(prefix="profitbase-tokens-")
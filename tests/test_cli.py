@@ -0,0 +1,44 @@
+import json
+
+import pytest
+from mock_server import MockProfitbase
+
+from anapolisdom_parser import TokenManager, main
+
+
+DOWN = ("pbdown", "https://down.invalid/", "http://127.0.0.1:9/")
+
+
+@pytest.fixture
+def tenants_file(tmp_path, monkeypatch):
+    # без повторов входа с отступом, чтобы тест не ждал
+    monkeypatch.setitem(TokenManager._managers, DOWN, TokenManager("pbdown", max_attempts=1, cache_dir=None))
+    with MockProfitbase(total=60) as mock:
+        tenants = [
+            {"profitbase_id": "pbgood", "host": "https://good.invalid/", "region": "Анапа", "base_url": mock.base_url},
+            # никто не слушает: арендатор недоступен
+            {"profitbase_id": DOWN[0], "host": DOWN[1], "region": "Анапа", "base_url": DOWN[2]},
+        ]
+        path = tmp_path / "tenants.json"
+        path.write_text(json.dumps(tenants), encoding="utf-8")
+        yield str(path)
+
+
+@pytest.mark.parametrize("format", ["json", "ndjson", "csv"])
+def test_unreachable_tenant_does_not_abort_the_others(tenants_file, tmp_path, format):
+    out = tmp_path / "out"
+    assert main(["--tenants", tenants_file, "--format", format, "-o", str(out), "--workers", "2"]) == 1
+    assert sorted(p.name for p in out.iterdir()) == ["pbdown.error.txt", f"pbgood.{format}"]
+    if format == "json":
+        assert len(json.loads((out / "pbgood.json").read_text(encoding="utf-8"))) == 180
+
+
+def test_several_tenants_need_an_output_directory(tenants_file):
+    with pytest.raises(SystemExit):
+        main(["--tenants", tenants_file])
+
+
+@pytest.mark.parametrize("format", ["ndjson", "csv", "parquet"])
+def test_changes_only_is_json(tmp_path, format):
+    with pytest.raises(SystemExit):
+        main(["--incremental", str(tmp_path), "--changes-only", "--format", format, "-o", str(tmp_path / "x")])
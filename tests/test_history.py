@@ -0,0 +1,66 @@
+from decimal import Decimal
+
+import pytest
+from mock_server import MockProfitbase
+
+from anapolisdom_parser import (
+    ApartmentParser,
+    EstateObject,
+    HistoryStore,
+    Tenant,
+    get_data,
+)
+
+
+@pytest.fixture
+def mock():
+    with MockProfitbase(total=150) as server:
+        yield server
+
+
+@pytest.fixture
+def history(tmp_path):
+    with HistoryStore(str(tmp_path / "history.sqlite")) as store:
+        yield store
+
+
+def record(price):
+    obj = EstateObject()
+    obj.flat_url = "https://example.invalid/#/profitbase/house/1/list?propertyId=1"
+    obj.type = "flat"
+    obj.price_base = price
+    obj.sale_status = "Свободна"
+    obj.in_sale = 1
+    return obj
+
+
+def test_trailing_zeros_are_not_a_change(history):
+    history.record_run("t", [record(Decimal("3507919"))])
+    counts = history.record_run("t", [record(Decimal("3507919.0"))])
+    assert counts == {"added": 0, "changed": 0, "removed": 0, "unchanged": 1}
+    assert history.record_run("t", [record(3507919.5)])["changed"] == 1
+
+
+def test_unchanged_catalog_through_snapshot_adds_no_rows(mock, history, tmp_path):
+    tenant = Tenant("pbhist", "https://example.invalid/", "Анапа", base_url=mock.base_url)
+    snapshot = str(tmp_path / "snapshot.json")
+    records = get_data(tenant, snapshot_path=snapshot, history=history)
+    rows = history.changed_since(0)
+    assert len(rows) == len(records) > 0
+
+    get_data(tenant, snapshot_path=snapshot, history=history)
+    assert history.changed_since(0) == rows
+
+
+def test_removals_are_limited_to_fetched_types(mock, history):
+    tenant = Tenant("pbtypes", "https://example.invalid/", "Анапа", base_url=mock.base_url)
+    get_data(tenant, history=history)
+    flats = Tenant(
+        "pbtypes",
+        "https://example.invalid/",
+        "Анапа",
+        base_url=mock.base_url,
+        parsers={"property": ApartmentParser},
+    )
+    get_data(flats, history=history)
+    assert not [row for row in history.changed_since(0) if row["removed"]]
@@ -0,0 +1,30 @@
+from mock_server import HOUSES, make_property
+
+from anapolisdom_parser import ApartmentParser, PARSERS
+
+
+def parser(parser_class=ApartmentParser):
+    return parser_class("https://example.invalid/", {house["id"]: "IV кв 2025" for house in HOUSES})
+
+
+def test_parse_page_matches_per_record_parse():
+    for prop_type, parser_class in PARSERS.items():
+        estate_parser = parser(parser_class)
+        items = [make_property(i, prop_type) for i in range(200)]
+        page = [record.to_tuple() for record in estate_parser.parse_page(items)]
+        assert page == [estate_parser.parse(data).to_tuple() for data in items]
+
+
+def test_isolated_page_parses_each_item_once():
+    good = make_property(1)
+    good["custom_fields"].append({"id": "sauna", "name": "Сауна", "value": "Есть"})
+    no_house = dict(make_property(2), house_id=-1)
+    no_price = dict(make_property(3), price={})
+    estate_parser = parser()
+    failed = []
+    records = estate_parser.parse_page_isolated(
+        [good, no_house, no_price], lambda data, e: failed.append((data["id"], type(e)))
+    )
+    assert [record.number for record in records] == [parser().parse(good).number]
+    assert failed == [(no_house["id"], KeyError), (no_price["id"], KeyError)]
+    assert estate_parser.feature_rules.unknown == {"Сауна": 1}